@@ -1,25 +1,100 @@
+import asyncio
 import os
-from typing import final
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, final
+import httpx
 from dotenv import load_dotenv
 from loguru import logger
-from openai import OpenAI
+from openai import APITimeoutError, AsyncOpenAI
 from datetime import datetime
 from openai.types.chat import ChatCompletionMessageParam
 
 _ = load_dotenv()
 
 
+class _StreamClaim:
+    """Lets exactly one of several concurrent model requests forward deltas."""
+
+    def __init__(self, on_delta: Callable[[str], Awaitable[None]]):
+        self.on_delta = on_delta
+        self.owner: str | None = None
+        self.forwarded = False
+
+    async def forward(self, model: str, delta: str):
+        if self.owner is None:
+            self.owner = model
+        if self.owner != model:
+            raise RuntimeError(f"{self.owner} is already streaming")
+        self.forwarded = True
+        await self.on_delta(delta)
+
+    def release(self, model: str):
+        # Once deltas went out the client holds part of this model's answer,
+        # so no other model may take over the stream
+        if self.owner == model and not self.forwarded:
+            self.owner = None
+
+    def broken_by(self, model: str) -> bool:
+        """Whether `model` failed after it had already streamed part of its answer."""
+        return self.forwarded and self.owner == model
+
+
+@dataclass
+class _Prompt:
+    """Message layout ordered from most stable to most volatile."""
+
+    system: str
+    context: str | None
+    history: list[ChatCompletionMessageParam]
+    user_request: str
+    # "code" or "answer": the two prompts differ a lot in length and output
+    kind: str = "answer"
+
+    def messages(self, cache_hints: bool) -> list[ChatCompletionMessageParam]:
+        blocks = [self.system] if self.context is None else [self.system, self.context]
+        system: ChatCompletionMessageParam
+        if cache_hints:
+            system = {
+                "role": "system",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": block,
+                        "cache_control": {"type": "ephemeral"},
+                    }
+                    for block in blocks
+                ],
+            }  # pyright: ignore[reportAssignmentType]
+        else:
+            system = {"role": "system", "content": "\n\n".join(blocks)}
+        return [system, *self.history, {"role": "user", "content": self.user_request}]
+
+
 @final
 class AiManager:
-    def __init__(self):
+    def __init__(
+        self, http_client: httpx.AsyncClient | None = None, hedging: bool = False
+    ):
         api_key = os.environ.get("OPENROUTER_API_KEY")
         if not api_key:
             logger.error("OPENROUTER_API_KEY environment variable not set.")
             raise ValueError("OPENROUTER_API_KEY environment variable not set.")
-        self.client: OpenAI = OpenAI(
+        if http_client is None:
+            # Keep-alive pool reused by every request made through this manager
+            http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=64, max_keepalive_connections=16
+                ),
+                timeout=10.0,
+            )
+        self._http_client = http_client
+        self.client: AsyncOpenAI = AsyncOpenAI(
             base_url="https://openrouter.ai/api/v1",
             api_key=api_key,
             timeout=10.0,
+            http_client=http_client,
         )
 
         self.model: str = "meta-llama/llama-4-maverick"
@@ -34,58 +109,193 @@ class AiManager:
         self.temperature: float = 0.0
         self.max_tokens = 10000
 
-    def _call_ai(
+        # Hedging: if a model hasn't answered within its p95 latency, start the
+        # next fallback in parallel and keep whichever completes first.
+        # Off by default, a hedged request may be billed by two providers.
+        self.hedging: bool = hedging
+        self.hedge_delay: float = 3.0
+        self.hedge_percentile: float = 0.95
+        self.hedge_min_samples: int = 5
+        # (model, prompt kind) -> recent latencies in seconds
+        self._latencies: dict[tuple[str, str], deque[float]] = {}
+
+    async def aclose(self):
+        await self.client.close()
+
+    def _extra_body(self, model: str) -> dict[str, Any] | None:
+        if model == "meta-llama/llama-4-maverick":
+            return {"provider": {"order": ["Fireworks"]}}
+        if model == "qwen/qwen-2.5-coder-32b-instruct":
+            return {"provider": {"order": ["Lambda", "Together", "Fireworks"]}}
+        if model == "deepseek/deepseek-chat-v3-0324":
+            return {"provider": {"order": ["Lambda", "Novita", "DeepInfra"]}}
+        return None
+
+    def _supports_cache_control(self, model: str) -> bool:
+        # OpenRouter honours explicit cache breakpoints for these providers;
+        # others cache a byte-identical prefix automatically
+        return model.startswith(("anthropic/", "google/gemini"))
+
+    def _record_latency(self, model: str, kind: str, seconds: float):
+        self._latencies.setdefault((model, kind), deque(maxlen=50)).append(seconds)
+
+    def _hedge_delay(self, model: str, kind: str) -> float:
+        """Seconds to wait on `model` before firing the next fallback in parallel."""
+        samples = self._latencies.get((model, kind))
+        if not samples or len(samples) < self.hedge_min_samples:
+            return self.hedge_delay
+        ordered = sorted(samples)
+        index = min(len(ordered) - 1, int(len(ordered) * self.hedge_percentile))
+        return ordered[index]
+
+    async def _complete(
         self,
-        system_prompt: str,
-        user_request: str,
-        model_override: str | None = None,
-        history: list[ChatCompletionMessageParam] | None = None,
+        model: str,
+        prompt: _Prompt,
+        stream: _StreamClaim | None = None,
+    ) -> str:
+        logger.info(f"Trying model: {model}")
+        messages = prompt.messages(cache_hints=self._supports_cache_control(model))
+        started = time.monotonic()
+        try:
+            completion = await self._request(model, messages, stream)
+        except (asyncio.CancelledError, APITimeoutError):
+            # A cancelled hedge loser or a timeout would have taken at least
+            # this long; dropping such samples biases the percentile towards
+            # the fast requests. A request cancelled early says nothing about
+            # the tail, so only the ones past the current delay are kept.
+            elapsed = time.monotonic() - started
+            if elapsed >= self._hedge_delay(model, prompt.kind):
+                self._record_latency(model, prompt.kind, elapsed)
+            raise
+        if not isinstance(completion, str) or not completion.strip():
+            raise ValueError(f"Empty completion from {model}")
+        latency = time.monotonic() - started
+        self._record_latency(model, prompt.kind, latency)
+        logger.info(f"Got completion from {model} in {latency:.2f}s")
+        return completion.strip()
+
+    async def _request(
+        self,
+        model: str,
+        messages: list[ChatCompletionMessageParam],
+        stream: _StreamClaim | None,
+    ) -> str | None:
+        if stream is None:
+            response = await self.client.chat.completions.create(
+                model=model,
+                temperature=self.temperature,
+                stream=False,
+                messages=messages,
+                # timeout=httpx.Timeout(10.0),
+                extra_body=self._extra_body(model),
+                max_completion_tokens=self.max_tokens,
+            )
+            completion = response.choices[0].message.content
+        else:
+            chunks = await self.client.chat.completions.create(
+                model=model,
+                temperature=self.temperature,
+                stream=True,
+                messages=messages,
+                extra_body=self._extra_body(model),
+                max_completion_tokens=self.max_tokens,
+            )
+            parts: list[str] = []
+            try:
+                async for chunk in chunks:
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        await stream.forward(model, delta)
+                        parts.append(delta)
+            except BaseException:
+                stream.release(model)
+                raise
+            completion = "".join(parts)
+        return completion
+
+    async def _call_sequential(
+        self,
+        models: list[str],
+        prompt: _Prompt,
+        stream: _StreamClaim | None = None,
     ) -> str:
-        models = [self.model] + self.fallbacks
-        if model_override is not None:
-            models[0] = model_override
         for model in models:
             try:
-                logger.info(f"Trying model: {model}")
-                extra_body = None
-                if model == "meta-llama/llama-4-maverick":
-                    extra_body = {"provider": {"order": ["Fireworks"]}}
-                if model == "qwen/qwen-2.5-coder-32b-instruct":
-                    extra_body = {
-                        "provider": {"order": ["Lambda", "Together", "Fireworks"]}
-                    }
-                if model == "deepseek/deepseek-chat-v3-0324":
-                    extra_body = {
-                        "provider": {"order": ["Lambda", "Novita", "DeepInfra"]}
-                    }
-                if history is None:
-                    history = []
-                messages: list[ChatCompletionMessageParam] = [
-                    {"role": "system", "content": system_prompt}
-                ]
-                messages.extend(history)
-                messages.append({"role": "user", "content": user_request})
-
-                response = self.client.chat.completions.create(
-                    model=model,
-                    temperature=self.temperature,
-                    stream=False,
-                    messages=messages,
-                    # timeout=httpx.Timeout(10.0),
-                    extra_body=extra_body,
-                    max_completion_tokens=self.max_tokens,
-                )
-                completion = response.choices[0].message.content
-                assert isinstance(completion, str)
-                logger.info(f"Got completion from {model}")
-                return completion.strip()
+                return await self._complete(model, prompt, stream)
             except Exception as e:
                 logger.warning(f"Error calling AI model {model}: {e}")
+                if stream is not None and stream.broken_by(model):
+                    raise Exception("AI stream failed after partial output") from e
                 continue
         logger.error("Could not get response from any AI model after trying all fallbacks.")
         raise Exception("Could not call AI")
 
-    def get_code_system_prompt(self, tasks: str, code_info: str):
+    async def _call_hedged(
+        self,
+        models: list[str],
+        prompt: _Prompt,
+        stream: _StreamClaim | None = None,
+    ) -> str:
+        remaining = list(models)
+        pending: set[asyncio.Task[str]] = set()
+        try:
+            while remaining or pending:
+                timeout = None
+                # Once a model is streaming to the client, stop hedging against it
+                if remaining and (stream is None or stream.owner is None or not pending):
+                    model = remaining.pop(0)
+                    pending.add(
+                        asyncio.create_task(
+                            self._complete(model, prompt, stream), name=model
+                        )
+                    )
+                    timeout = self._hedge_delay(model, prompt.kind) if remaining else None
+                done, pending = await asyncio.wait(
+                    pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    logger.info(f"No completion after {timeout:.2f}s, hedging")
+                for task in done:
+                    try:
+                        return task.result()
+                    except Exception as e:
+                        model = task.get_name()
+                        logger.warning(f"Error calling AI model {model}: {e}")
+                        if stream is not None and stream.broken_by(model):
+                            raise Exception(
+                                "AI stream failed after partial output"
+                            ) from e
+        finally:
+            for task in pending:
+                _ = task.cancel()
+        logger.error("Could not get response from any AI model after trying all fallbacks.")
+        raise Exception("Could not call AI")
+
+    async def _call_ai(
+        self,
+        system_prompt: str,
+        user_request: str,
+        model_override: str | None = None,
+        history: list[ChatCompletionMessageParam] | None = None,
+        on_delta: Callable[[str], Awaitable[None]] | None = None,
+        context: str | None = None,
+        kind: str = "answer",
+    ) -> str:
+        models = [self.model] + self.fallbacks
+        if model_override is not None:
+            models[0] = model_override
+        prompt = _Prompt(system_prompt, context, history or [], user_request, kind)
+
+        stream = _StreamClaim(on_delta) if on_delta is not None else None
+        if self.hedging:
+            return await self._call_hedged(models, prompt, stream)
+        return await self._call_sequential(models, prompt, stream)
+
+    def get_code_system_prompt(self, code_info: str):
+        # Only stable content here: it is the cached prefix of every code request
         prompt = f"""<info>
 You are programming agent that works with Tasks API.
 Your goal is to read user's request (that can be in Russian)
@@ -99,15 +309,6 @@ ALWAYS make sure your code correctly uses it's methods and parameters, do not in
 {code_info}
 </code>
 
-<tasks>
-Here's an overview of user's tasks, grouped by projects, with optional due date
-{tasks}
-</tasks>
-
-<date>
-Today is {datetime.now().strftime("%d %b %Y %H:%M")}
-</date>
-
 <constraints>
 Output ONLY Python code, that will be directly executed in Python environment
 Do not comment code
@@ -124,13 +325,31 @@ Always print() the answer of interest
     """
         return prompt
 
-    def get_code_ai_response(self, context: str, code_info: str, user_request: str, history=None):
-        prompt = self.get_code_system_prompt(context, code_info)
-        user_request = f"""<user_request>
+    def get_tasks_prompt(self, tasks: str) -> str:
+        return f"""<tasks>
+Here's an overview of user's tasks, grouped by projects, with optional due date
+{tasks}
+</tasks>"""
+
+    async def get_code_ai_response(
+        self,
+        context: str,
+        code_info: str,
+        user_request: str,
+        history=None,
+        on_delta: Callable[[str], Awaitable[None]] | None = None,
+    ):
+        prompt = self.get_code_system_prompt(code_info)
+        # The date changes every minute, so it goes last, next to the request
+        user_request = f"""<date>
+Today is {datetime.now().strftime("%d %b %Y %H:%M")}
+</date>
+
+<user_request>
 {user_request}
 </user_request>
         """.strip()
-        completion = self._call_ai(
+        completion = await self._call_ai(
             prompt,
             user_request,
             # model_override="anthropic/claude-3.7-sonnet",
@@ -139,6 +358,9 @@ Always print() the answer of interest
             model_override="google/gemini-2.5-flash",
             # model_override="deepseek/deepseek-chat-v3-0324",
             history=history,
+            on_delta=on_delta,
+            context=self.get_tasks_prompt(context),
+            kind="code",
         )
         if completion.startswith("```"):
             completion = completion[3:]
@@ -149,7 +371,14 @@ Always print() the answer of interest
         completion = completion.replace("<|python_end|>", "")
         return completion.strip()
 
-    def get_answer_ai_response(self, task: str, code: str, output: str, history=None) -> str:
+    async def get_answer_ai_response(
+        self,
+        task: str,
+        code: str,
+        output: str,
+        history=None,
+        on_delta: Callable[[str], Awaitable[None]] | None = None,
+    ) -> str:
         prompt = """<info>
 You are given users' request, Python code and result of it's execution (stdout code output)
 If code executed successfully, you should describe the result of it's execution, do not describe code in this case
@@ -202,5 +431,7 @@ You have 2 tasks today
         {output}
         </output>
         """.strip()
-        completion = self._call_ai(prompt, user_request, history=history)
+        completion = await self._call_ai(
+            prompt, user_request, history=history, on_delta=on_delta
+        )
         return completion
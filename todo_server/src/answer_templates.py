@@ -0,0 +1,164 @@
+"""
+Answers for common shapes of code output that do not need a model call:
+counts, short lists of names, confirmations of changes and sandbox errors.
+"""
+
+import ast
+import re
+from collections.abc import Mapping
+
+_SUCCESS_PREFIX = "Successfully executed code:"
+_ERROR_PREFIX = "Error executing code:"
+_INT = re.compile(r"^\d+$")
+_ID_LIKE = re.compile(r"\b(?=\w*\d)[0-9A-Za-z]{8,}\b")
+_REPR_LIKE = re.compile(r"\w+\(.*=|\bid\b|[{}\[\]]", re.IGNORECASE)
+
+MAX_LIST_LINES = 10
+MAX_LINE_CHARS = 150
+
+_MUTATIONS = {"add_task", "complete_task", "add_project", "remove_project"}
+# Sync API command type -> (answer for one command, answer for several)
+_CONFIRMATIONS = {
+    "item_add": ("Задача добавлена.", "Задачи добавлены."),
+    "item_close": ("Задача отмечена выполненной.", "Задачи отмечены выполненными."),
+    "project_add": ("Проект создан.", "Проекты созданы."),
+    "project_delete": ("Проект удалён.", "Проекты удалены."),
+}
+# Read method -> (one, few, many) noun forms
+_NOUNS = {
+    "get_tasks": ("задача", "задачи", "задач"),
+    "get_all_projects": ("проект", "проекта", "проектов"),
+}
+# Read method -> attribute that holds the name of what it returns
+_NAME_ATTRS = {"get_tasks": "content", "get_all_projects": "name"}
+_SANDBOX_ERRORS = {
+    "timed out": "Запрос выполнялся слишком долго и был остановлен.",
+    "memory limit exceeded": "Запросу не хватило памяти, попробуйте сузить его.",
+    "worker process died": "Запрос завершился аварийно, попробуйте ещё раз.",
+}
+
+
+def plural(n: int, forms: tuple[str, str, str]) -> str:
+    if n % 10 == 1 and n % 100 != 11:
+        return forms[0]
+    if 2 <= n % 10 <= 4 and not 12 <= n % 100 <= 14:
+        return forms[1]
+    return forms[2]
+
+
+def _client_method(node: ast.AST) -> str | None:
+    """`name` for a `client.<name>(...)` call."""
+    if (
+        isinstance(node, ast.Call)
+        and isinstance(node.func, ast.Attribute)
+        and isinstance(node.func.value, ast.Name)
+        and node.func.value.id == "client"
+    ):
+        return node.func.attr
+    return None
+
+
+def _output_shape(tree: ast.AST) -> str | None:
+    """
+    "count" when every print() prints a len(...), "names" when every print()
+    prints the name of a task or project the loop around it iterates over.
+    """
+    # Loop variable -> read method it iterates over
+    loop_vars: dict[str, str] = {}
+    for node in ast.walk(tree):
+        if isinstance(node, ast.For) and isinstance(node.target, ast.Name):
+            method = _client_method(node.iter)
+            if method in _NAME_ATTRS:
+                loop_vars[node.target.id] = method
+    shapes: set[str] = set()
+    for node in ast.walk(tree):
+        if not (
+            isinstance(node, ast.Call)
+            and isinstance(node.func, ast.Name)
+            and node.func.id == "print"
+        ):
+            continue
+        if len(node.args) != 1 or node.keywords:
+            return None
+        arg = node.args[0]
+        if (
+            isinstance(arg, ast.Call)
+            and isinstance(arg.func, ast.Name)
+            and arg.func.id == "len"
+        ):
+            shapes.add("count")
+        elif (
+            isinstance(arg, ast.Attribute)
+            and isinstance(arg.value, ast.Name)
+            and arg.value.id in loop_vars
+            and arg.attr == _NAME_ATTRS[loop_vars[arg.value.id]]
+        ):
+            shapes.add("names")
+        else:
+            return None
+    return shapes.pop() if len(shapes) == 1 else None
+
+
+def template_answer(
+    code: str, exec_result: str, writes: Mapping[str, int]
+) -> str | None:
+    """
+    Returns a ready answer, or None when the output needs the model.
+    `writes` counts the Sync API commands of the script Todoist accepted.
+    """
+    if exec_result.startswith(_ERROR_PREFIX):
+        reason = exec_result.removeprefix(_ERROR_PREFIX).split("\n", 1)[0]
+        for marker, answer in _SANDBOX_ERRORS.items():
+            if marker in reason:
+                return answer
+        # Exceptions raised by the script itself are for the model to explain
+        return None
+    if not exec_result.startswith(_SUCCESS_PREFIX):
+        return None
+
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return None
+    calls = {name for node in ast.walk(tree) if (name := _client_method(node))}
+    output = exec_result.removeprefix(_SUCCESS_PREFIX).strip()
+    lines = [line.strip() for line in output.splitlines() if line.strip()]
+
+    if calls & _MUTATIONS or writes:
+        # Confirm only what was actually written, e.g. a loop over an empty
+        # result writes nothing and the model has to explain that
+        kinds = [kind for kind, count in writes.items() if count]
+        if len(kinds) != 1 or kinds[0] not in _CONFIRMATIONS:
+            return None
+        if output not in ("", "True", "None"):
+            return None
+        single, many = _CONFIRMATIONS[kinds[0]]
+        return many if writes[kinds[0]] > 1 else single
+
+    reads = [name for name in calls if name in _NOUNS]
+    if len(reads) != 1:
+        return None
+    forms = _NOUNS[reads[0]]
+    # Output of any other shape, e.g. a sentence or a flag, needs the model
+    shape = _output_shape(tree)
+    if shape is None:
+        return None
+    if not lines or lines == ["0"]:
+        return f"{forms[2].capitalize()} не найдено."
+    # Phrased as a reply to the user's question: the count is of whatever the
+    # request asked for, not of all tasks, so no "всего"
+    if shape == "count":
+        if len(lines) != 1 or not _INT.match(lines[0]):
+            return None
+        n = int(lines[0])
+        return f"{n} {plural(n, forms)}."
+    if len(lines) > MAX_LIST_LINES:
+        return None
+    for line in lines:
+        if len(line) > MAX_LINE_CHARS or _ID_LIKE.search(line):
+            return None
+        if _REPR_LIKE.search(line) or _INT.match(line):
+            return None
+    n = len(lines)
+    names = "; ".join(line.rstrip(".") for line in lines)
+    return f"{n} {plural(n, forms)}: {names}."
@@ -0,0 +1,62 @@
+"""
+Bounded buffer for incoming audio that moves to a temp file once it grows
+past a threshold, so long recordings do not stay in worker memory.
+"""
+
+import io
+import os
+import tempfile
+from typing import BinaryIO, final
+
+
+class AudioTooLargeError(Exception):
+    pass
+
+
+@final
+class IngestBuffer:
+    def __init__(
+        self,
+        max_bytes: int = 25 * 1024 * 1024,
+        spill_bytes: int = 1024 * 1024,
+    ):
+        """
+        Holds up to `spill_bytes` in memory and the rest in an anonymous temp
+        file. Writing past `max_bytes` raises AudioTooLargeError.
+        25 MB is also the largest upload Groq transcription accepts.
+        """
+        self.max_bytes = max_bytes
+        self.spill_bytes = spill_bytes
+        self._file: BinaryIO = io.BytesIO()
+        self._size = 0
+        self._spilled = False
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def spilled(self) -> bool:
+        return self._spilled
+
+    def write(self, chunk: bytes):
+        size = self._size + len(chunk)
+        if size > self.max_bytes:
+            raise AudioTooLargeError(
+                f"Audio exceeds the limit of {self.max_bytes // (1024 * 1024)} MB"
+            )
+        if not self._spilled and size > self.spill_bytes:
+            assert isinstance(self._file, io.BytesIO)
+            spill_file = tempfile.TemporaryFile()
+            _ = spill_file.write(self._file.getbuffer())
+            self._file = spill_file
+            self._spilled = True
+        _ = self._file.write(chunk)
+        self._size = size
+
+    def file(self) -> BinaryIO:
+        """The buffered audio as a file object positioned at the start, no copy."""
+        _ = self._file.seek(0, os.SEEK_SET)
+        return self._file
+
+    def close(self):
+        self._file.close()
@@ -0,0 +1,121 @@
+"""
+Content-addressed cache of synthesized speech with an in-memory LRU tier
+and an on-disk tier, both bounded in bytes.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import final
+
+from loguru import logger
+
+
+def audio_key(text: str, model: str, voice: str, output_format: str) -> str:
+    payload = json.dumps([text.strip(), model, voice, output_format])
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+@final
+class AudioCache:
+    def __init__(
+        self,
+        directory: str,
+        max_memory_bytes: int = 8 * 1024 * 1024,
+        max_disk_bytes: int = 256 * 1024 * 1024,
+    ):
+        """
+        Disk entries are evicted least recently used first once they exceed
+        `max_disk_bytes`; reads refresh the file mtime to track recency.
+        """
+        self.directory = directory
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        os.makedirs(directory, exist_ok=True)
+        self._memory: OrderedDict[str, bytes] = OrderedDict()
+        self._memory_bytes = 0
+        # Streaming synthesis stores from worker threads
+        self._lock = threading.Lock()
+        self._disk_bytes = sum(size for _, _, size in self._disk_entries())
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.audio")
+
+    def _disk_entries(self) -> list[tuple[float, str, int]]:
+        entries: list[tuple[float, str, int]] = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".audio"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.path, stat.st_size))
+        return entries
+
+    def get(self, key: str) -> bytes | None:
+        with self._lock:
+            audio = self._memory.get(key)
+            if audio is not None:
+                self._memory.move_to_end(key)
+                return audio
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                audio = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.warning(f"Failed to read cached audio {key}: {e}")
+            return None
+        with self._lock:
+            self._remember(key, audio)
+        return audio
+
+    def put(self, key: str, audio: bytes):
+        if not audio:
+            return
+        with self._lock:
+            self._remember(key, audio)
+        path = self._path(key)
+        if os.path.exists(path):
+            return
+        # Unique per thread and process, several workers may share the directory
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                _ = f.write(audio)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Failed to write cached audio {key}: {e}")
+            return
+        with self._lock:
+            self._disk_bytes += len(audio)
+            if self._disk_bytes > self.max_disk_bytes:
+                self._evict_disk()
+
+    def _remember(self, key: str, audio: bytes):
+        if len(audio) > self.max_memory_bytes:
+            return
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= len(old)
+        self._memory[key] = audio
+        self._memory_bytes += len(audio)
+        while self._memory_bytes > self.max_memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    def _evict_disk(self):
+        entries = sorted(self._disk_entries())
+        total = sum(size for _, _, size in entries)
+        # Evict down to 90% so that eviction does not rescan on every put
+        target = self.max_disk_bytes * 9 // 10
+        for _, path, size in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+        self._disk_bytes = total
@@ -0,0 +1,77 @@
+"""
+Splits a raw PCM audio stream into segments that can be transcribed
+independently while the rest of the recording is still uploading.
+"""
+
+import io
+import math
+import wave
+from array import array
+from typing import final
+
+
+def pcm_to_wav(pcm: bytes, sample_rate: int) -> bytes:
+    """Wraps 16-bit mono PCM into a WAV container."""
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(pcm)
+    return buffer.getvalue()
+
+
+@final
+class AudioSegmenter:
+    """
+    Accumulates 16-bit mono PCM and cuts it into segments at pauses.
+
+    A segment is emitted once it is at least `min_seconds` long and the
+    last `silence_seconds` of it are below `silence_rms`, or once it
+    reaches `max_seconds` regardless of content.
+    """
+
+    def __init__(
+        self,
+        sample_rate: int = 16000,
+        min_seconds: float = 4.0,
+        max_seconds: float = 20.0,
+        silence_seconds: float = 0.4,
+        silence_rms: float = 500.0,
+    ):
+        self.sample_rate = sample_rate
+        self._min_bytes = int(min_seconds * sample_rate) * 2
+        self._max_bytes = int(max_seconds * sample_rate) * 2
+        self._silence_bytes = int(silence_seconds * sample_rate) * 2
+        self._silence_rms = silence_rms
+        self._buffer = bytearray()
+
+    def __len__(self) -> int:
+        return len(self._buffer)
+
+    def _is_silent(self, pcm: bytes) -> bool:
+        samples = array("h", pcm[: len(pcm) - len(pcm) % 2])
+        if not samples:
+            return True
+        rms = math.sqrt(sum(s * s for s in samples) / len(samples))
+        return rms < self._silence_rms
+
+    def feed(self, chunk: bytes) -> list[bytes]:
+        """Adds `chunk` and returns the PCM segments it completed, if any."""
+        self._buffer.extend(chunk)
+        segments: list[bytes] = []
+        while len(self._buffer) >= self._max_bytes:
+            segments.append(bytes(self._buffer[: self._max_bytes]))
+            del self._buffer[: self._max_bytes]
+        if len(self._buffer) >= self._min_bytes and self._is_silent(
+            self._buffer[-self._silence_bytes :]
+        ):
+            segments.append(bytes(self._buffer))
+            self._buffer.clear()
+        return segments
+
+    def flush(self) -> bytes:
+        """Returns whatever audio is left after the last emitted segment."""
+        rest = bytes(self._buffer)
+        self._buffer.clear()
+        return rest
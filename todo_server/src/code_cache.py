@@ -0,0 +1,170 @@
+"""
+Cache of generated code keyed by normalized user requests.
+
+String and number literals of the generated code that also appear in the
+request become parameter slots, so "найди задачу купить хлеб" can reuse the
+code generated for "найди задачу купить молоко". Only read-only code whose
+literals all come from the request is cached: anything else depends on the
+date, the task context or the conversation and must not be replayed.
+"""
+
+import ast
+import hashlib
+import re
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Iterable, final
+
+_NON_WORD = re.compile(r"[^\w\s]")
+_SPACES = re.compile(r"\s+")
+# TaskClient methods that change data
+_MUTATING_PREFIXES = ("add_", "remove_", "complete_")
+# Integers common in code that does not depend on the request (indexes, steps)
+_FREE_INTS = {0, 1}
+
+
+def normalize_request(text: str) -> str:
+    text = _NON_WORD.sub(" ", text.lower())
+    return _SPACES.sub(" ", text).strip()
+
+
+@dataclass
+class _Entry:
+    pattern: re.Pattern[str]
+    code: str
+    # Slot placeholder -> whether the original literal was capitalized
+    slots: dict[str, bool]
+
+
+@final
+class CodeCache:
+    def __init__(self, max_entries: int = 500):
+        self.max_entries = max_entries
+        self._spec_hash: str | None = None
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+
+    def _check_spec(self, code_info: str):
+        spec_hash = hashlib.sha256(code_info.encode()).hexdigest()
+        if spec_hash != self._spec_hash:
+            # Cached code may use methods that changed or no longer exist
+            self._entries.clear()
+            self._spec_hash = spec_hash
+
+    def lookup(self, request: str, code_info: str) -> str | None:
+        self._check_spec(code_info)
+        normalized = normalize_request(request)
+        for key, entry in reversed(self._entries.items()):
+            match = entry.pattern.fullmatch(normalized)
+            if match is None:
+                continue
+            self._entries.move_to_end(key)
+            code = entry.code
+            for slot, capitalized in entry.slots.items():
+                value = match.group(slot)
+                if capitalized:
+                    value = value[:1].upper() + value[1:]
+                code = code.replace(f"__{slot}__", value)
+            return code
+        return None
+
+    def evict(self, request: str):
+        normalized = normalize_request(request)
+        for key, entry in list(self._entries.items()):
+            if entry.pattern.fullmatch(normalized):
+                del self._entries[key]
+
+    def store(self, request: str, code: str, code_info: str) -> bool:
+        """
+        Remembers code that executed successfully for `request`, returning
+        whether it was cacheable.
+        """
+        self._check_spec(code_info)
+        normalized = normalize_request(request)
+        try:
+            tree = ast.parse(code)
+        except SyntaxError:
+            return False
+
+        # Slot value -> (start, end, is_int) of its span in the request
+        spans: dict[str, tuple[int, int, bool]] = {}
+        literals: list[tuple[ast.Constant, str]] = []
+        for node in ast.walk(tree):
+            if (
+                isinstance(node, ast.Call)
+                and isinstance(node.func, ast.Attribute)
+                and node.func.attr.startswith(_MUTATING_PREFIXES)
+            ):
+                return False
+            if not isinstance(node, ast.Constant):
+                continue
+            value = node.value
+            if value is None or isinstance(value, bool) or value in _FREE_INTS:
+                continue
+            if isinstance(value, str) and not normalize_request(value):
+                # Separators and punctuation only, e.g. "\n".join(...)
+                continue
+            if not isinstance(value, (str, int)) or node.end_lineno != node.lineno:
+                return False
+            is_int = isinstance(value, int)
+            slot_value = str(value) if is_int else normalize_request(value)
+            if not is_int and slot_value != value.lower():
+                return False
+            if slot_value not in spans:
+                span = _find_span(normalized, slot_value, spans.values())
+                if span is None:
+                    # A date, task name or other literal not taken from the request
+                    return False
+                spans[slot_value] = (*span, is_int)
+            literals.append((node, slot_value))
+
+        slots: dict[str, bool] = {}
+        slot_names: dict[str, str] = {}
+        parts: list[str] = []
+        position = 0
+        ordered = sorted(spans.items(), key=lambda item: item[1][0])
+        for i, (slot_value, (start, end, is_int)) in enumerate(ordered):
+            slot = f"s{i}"
+            slot_names[slot_value] = slot
+            parts.append(re.escape(normalized[position:start]))
+            parts.append(rf"(?P<{slot}>\d+)" if is_int else rf"(?P<{slot}>.+?)")
+            position = end
+        parts.append(re.escape(normalized[position:]))
+        template = "".join(parts)
+
+        replacements: list[tuple[int, int, int, str]] = []
+        for node, slot_value in literals:
+            slot = slot_names[slot_value]
+            if isinstance(node.value, str):
+                slots.setdefault(slot, node.value[:1].isupper())
+                placeholder = repr(f"__{slot}__")
+            else:
+                slots.setdefault(slot, False)
+                placeholder = f"__{slot}__"
+            assert node.end_col_offset is not None
+            replacements.append(
+                (node.lineno, node.col_offset, node.end_col_offset, placeholder)
+            )
+
+        # AST offsets are in UTF-8 bytes; substitute from the end backwards
+        lines = [line.encode() for line in code.splitlines(keepends=True)]
+        for lineno, start, end, placeholder in sorted(replacements, reverse=True):
+            line = lines[lineno - 1]
+            lines[lineno - 1] = line[:start] + placeholder.encode() + line[end:]
+        code_template = b"".join(lines).decode()
+
+        self._entries[template] = _Entry(re.compile(template), code_template, slots)
+        self._entries.move_to_end(template)
+        while len(self._entries) > self.max_entries:
+            _ = self._entries.popitem(last=False)
+        return True
+
+
+def _find_span(
+    text: str, value: str, taken: Iterable[tuple[int, int, bool]]
+) -> tuple[int, int] | None:
+    """The first whole-word occurrence of `value` not overlapping `taken`."""
+    for match in re.finditer(rf"(?<!\w){re.escape(value)}(?!\w)", text):
+        start, end = match.span()
+        if all(end <= first or start >= last for first, last, _ in taken):
+            return start, end
+    return None
@@ -1,5 +1,13 @@
 import io
+import asyncio
+import builtins
 import contextlib
+import inspect
+import multiprocessing
+from collections import Counter
+from multiprocessing.connection import Connection
+from multiprocessing.process import BaseProcess
+from typing import Any, final
 from loguru import logger
 
 from src.task_client import TaskClient
@@ -12,33 +20,298 @@ from src.todoist_manager import (
     FilterTaskNameMatches,
 )
 
+# TaskClient methods that write; the batching client only queues them
+_WRITE_PREFIXES = ("add_", "remove_", "complete_")
 
+# Generated code is told not to import anything, these cover what it still does
+_ALLOWED_IMPORTS = {"datetime", "math", "re", "collections", "itertools", "functools"}
+# The C datetime module imports these lazily through the script's __import__,
+# e.g. for date.today(), strftime() and strptime()
+_IMPLICIT_IMPORTS = {"time", "_strptime"}
+_DENIED_BUILTINS = {
+    "open",
+    "eval",
+    "exec",
+    "compile",
+    "input",
+    "breakpoint",
+    "help",
+    "exit",
+    "quit",
+    "globals",
+    "locals",
+    "vars",
+    "memoryview",
+}
+
+
+def _restricted_import(
+    name: str,
+    globals: Any = None,
+    locals: Any = None,
+    fromlist: Any = (),
+    level: int = 0,
+) -> Any:
+    allowed = _ALLOWED_IMPORTS | _IMPLICIT_IMPORTS
+    if level != 0 or name.split(".", 1)[0] not in allowed:
+        raise ImportError(f"Import of {name} is not allowed")
+    return builtins.__import__(name, globals, locals, fromlist, level)
+
+
+def _restricted_builtins() -> dict[str, Any]:
+    """
+    Keeps honest scripts away from files, the network and dynamic code.
+    Not a security boundary on its own: the worker process limits are.
+    """
+    allowed = {
+        name: value
+        for name, value in vars(builtins).items()
+        if name not in _DENIED_BUILTINS
+    }
+    allowed["__import__"] = _restricted_import
+    return allowed
+
+
+def _execution_scope(client: Any) -> dict[str, Any]:
+    return {
+        "__builtins__": _restricted_builtins(),
+        "client": client,
+        "FilterProjectId": FilterProjectId,
+        "FilterProjectName": FilterProjectName,
+        "FilterTaskNameMatches": FilterTaskNameMatches,
+        "FilterTaskDue": FilterTaskDue,
+        "FilterAND": FilterAND,
+        "FilterOR": FilterOR,
+    }
+
+
+def _run_code(client: Any, code: str) -> str:
+    stdout_capture = io.StringIO()
+    try:
+        execution_scope = _execution_scope(client)
+        with contextlib.redirect_stdout(stdout_capture):
+            exec(code, execution_scope, execution_scope)
+        captured_output = stdout_capture.getvalue().strip()
+        result_message = f"Successfully executed code:\n {captured_output}".strip()
+        logger.info(result_message)
+        return result_message
+
+    except MemoryError:
+        # Reported by the worker, which knows it ran into its memory limit
+        raise
+    except Exception as e:
+        captured_output = stdout_capture.getvalue().strip()
+        error_message = f"Error executing code: {e}\nstdout: {captured_output}"
+        logger.error(error_message)
+        return error_message
+
+
+class _ClientProxy:
+    """Stands in for TaskClient inside a worker; calls go back to the server."""
+
+    def __init__(self, conn: Connection):
+        self._conn = conn
+
+    def __getattr__(self, name: str):
+        if name.startswith("_") or not hasattr(TaskClient, name):
+            raise AttributeError(name)
+        if isinstance(inspect.getattr_static(TaskClient, name), staticmethod):
+            return getattr(TaskClient, name)
+
+        def call(*args: Any, **kwargs: Any) -> Any:
+            self._conn.send(("call", name, args, kwargs))
+            status, value = self._conn.recv()
+            if status == "error":
+                raise value
+            return value
+
+        return call
+
+
+def _worker_main(conn: Connection, memory_limit: int | None):
+    if memory_limit is not None:
+        import resource
+
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+    logger.remove()
+    client = _ClientProxy(conn)
+    while True:
+        try:
+            _, code = conn.recv()
+        except EOFError:
+            return
+        try:
+            result = _run_code(client, code)
+        except MemoryError:
+            result = "Error executing code: memory limit exceeded"
+        conn.send(("done", result))
+
+
+async def _recv(conn: Connection) -> Any:
+    """Waits for a message on the event loop instead of a blocked thread."""
+    loop = asyncio.get_running_loop()
+    fd = conn.fileno()
+    while not conn.poll():
+        readable = loop.create_future()
+        loop.add_reader(fd, lambda: readable.done() or readable.set_result(None))
+        try:
+            await readable
+        finally:
+            _ = loop.remove_reader(fd)
+    # The worker sends whole messages at once, so this does not wait for long
+    return conn.recv()
+
+
+def _log_flush_result(flush: "asyncio.Future[None]"):
+    if not flush.cancelled() and flush.exception() is not None:
+        logger.error(f"Failed to save changes of the script: {flush.exception()}")
+
+
+@final
+class _Worker:
+    def __init__(self, context: Any, memory_limit: int | None):
+        self.conn, child_conn = multiprocessing.Pipe()
+        self.process: BaseProcess = context.Process(
+            target=_worker_main, args=(child_conn, memory_limit), daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+
+    def kill(self):
+        self.process.kill()
+        self.conn.close()
+
+
+@final
 class CodeManager:
-    def __init__(self):
-        pass
+    def __init__(
+        self,
+        workers: int = 2,
+        timeout: float = 20.0,
+        memory_limit: int | None = 512 * 1024 * 1024,
+    ):
+        """
+        Generated code runs in a pool of `workers` pre-started processes, each
+        limited to `memory_limit` bytes of address space and `timeout` seconds
+        of wall-clock time per script.
+        """
+        self.workers = workers
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        self._context = multiprocessing.get_context("spawn")
+        self._idle: asyncio.Queue[_Worker] | None = None
+        # Idle and busy workers, so that aclose can stop all of them
+        self._all: set[_Worker] = set()
+
+    def start(self):
+        self._idle = asyncio.Queue()
+        for _ in range(self.workers):
+            self._idle.put_nowait(self._spawn())
+
+    def _spawn(self) -> _Worker:
+        worker = _Worker(self._context, self.memory_limit)
+        self._all.add(worker)
+        return worker
+
+    def _retire(self, worker: _Worker):
+        worker.kill()
+        self._all.discard(worker)
+
+    async def aclose(self):
+        if self._idle is None:
+            return
+        idle, self._idle = self._idle, None
+        while not idle.empty():
+            self._retire(idle.get_nowait())
+        # A busy worker's run sees EOF once its process is gone and retires it
+        for worker in self._all:
+            worker.process.kill()
 
     def execute(self, client: TaskClient, code: str) -> str:
-        stdout_capture = io.StringIO()
+        """Runs `code` in-process. Blocks the caller until it finishes."""
+        return _run_code(client, code)
+
+    async def run(
+        self, client: TaskClient, code: str, writes: Counter[str] | None = None
+    ) -> str:
+        """
+        Runs `code` in a worker process without blocking the event loop.
+        Writes of the script are batched and sent when it finishes; the Sync
+        API command types that Todoist accepted are counted into `writes`.
+        """
+        if self._idle is None:
+            self.start()
+        idle = self._idle
+        assert idle is not None
+        client = client.batched()
+        worker = await idle.get()
+        healthy = False
+        result = "Error executing code: cancelled"
+        flush_error: Exception | None = None
         try:
-            execution_scope = {
-                "client": client,
-                "FilterProjectId": FilterProjectId,
-                "FilterProjectName": FilterProjectName,
-                "FilterTaskNameMatches": FilterTaskNameMatches,
-                "FilterTaskDue": FilterTaskDue,
-                "FilterAND": FilterAND,
-                "FilterOR": FilterOR,
-            }
-
-            with contextlib.redirect_stdout(stdout_capture):
-                exec(code, execution_scope, execution_scope)
-            captured_output = stdout_capture.getvalue().strip()
-            result_message = f"Successfully executed code:\n {captured_output}".strip()
-            logger.info(result_message)
-            return result_message
+            async with asyncio.timeout(self.timeout):
+                result = await self._serve(worker, client, code)
+            healthy = True
+        except TimeoutError:
+            result = f"Error executing code: timed out after {self.timeout}s"
+            logger.error(result)
+        except (EOFError, ConnectionError):
+            result = "Error executing code: worker process died"
+            logger.error(result)
+        finally:
+            closed = self._idle is not idle
+            if not healthy or closed:
+                # Also covers cancellation: the script may still be running
+                self._retire(worker)
+            if not closed:
+                self._idle.put_nowait(worker if healthy else self._spawn())
+            # Writes made before a failure or a cancellation have happened
+            # without batching too, so they are sent in every case
+            flush_error = await self._flush(client)
+            if writes is not None:
+                writes.update(client.committed)
+
+        if flush_error is not None:
+            error_message = f"Error executing code: failed to save changes: {flush_error}"
+            result = f"{error_message}\n{result}"
+            logger.error(result)
+        return result
 
+    async def _flush(self, client: TaskClient) -> Exception | None:
+        # Shielded: a cancelled request must not abort a commit half way
+        flush = asyncio.ensure_future(client.flush())
+        try:
+            await asyncio.shield(flush)
+        except asyncio.CancelledError:
+            flush.add_done_callback(_log_flush_result)
+            raise
         except Exception as e:
-            captured_output = stdout_capture.getvalue().strip()
-            error_message = f"Error executing code: {e}\nstdout: {captured_output}"
-            logger.error(error_message)
-            return error_message
+            logger.error(f"Failed to save changes of the script: {e}")
+            return e
+        return None
+
+    async def _serve(self, worker: _Worker, client: TaskClient, code: str) -> str:
+        worker.conn.send(("run", code))
+        while True:
+            message = await _recv(worker.conn)
+            if message[0] == "done":
+                return message[1]
+            _, name, args, kwargs = message
+            try:
+                if name.startswith("_"):
+                    raise AttributeError(name)
+                method = getattr(client, name)
+                if not name.startswith(_WRITE_PREFIXES):
+                    # Reads must see the writes queued before them
+                    await client.flush()
+                value = method(*args, **kwargs)
+            except Exception as e:
+                value = e
+                status = "error"
+            else:
+                status = "result"
+            try:
+                worker.conn.send((status, value))
+            except Exception as e:
+                # Unpicklable value or exception; the script still gets an error
+                worker.conn.send(("error", RuntimeError(f"{name} failed: {e}")))
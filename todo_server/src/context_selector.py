@@ -0,0 +1,75 @@
+"""
+Ranks tasks by relevance to a user request so that the prompt context can be
+cut down to a token budget.
+"""
+
+import re
+from datetime import date, datetime, timezone
+from typing import Iterable
+
+from todoist_api_python.models import Project, Task
+
+_WORD = re.compile(r"\w+")
+# Crude stemming: Russian requests inflect nouns, so compare word prefixes
+_STEM_LENGTH = 4
+
+
+def estimate_tokens(text: str) -> int:
+    # Cyrillic text tokenizes denser than English, so stay on the safe side
+    return len(text) // 3 + 1
+
+
+def _stems(text: str) -> set[str]:
+    return {
+        word[:_STEM_LENGTH] for word in _WORD.findall(text.lower()) if len(word) >= 3
+    }
+
+
+def _due_score(task: Task, today: date) -> float:
+    if not task.due:
+        return 0.0
+    due = task.due.date
+    due_day = due.date() if isinstance(due, datetime) else due
+    days = (due_day - today).days
+    if days < 0:
+        return 2.0  # overdue
+    if days <= 7:
+        return 2.0 - days / 7
+    return 0.0
+
+
+def _recency_score(task: Task, now: datetime) -> float:
+    updated_at = getattr(task, "updated_at", None)
+    if not isinstance(updated_at, datetime):
+        return 0.0
+    if updated_at.tzinfo is None:
+        updated_at = updated_at.replace(tzinfo=timezone.utc)
+    days = (now - updated_at).total_seconds() / 86400
+    return max(0.0, 1.0 - days / 14)
+
+
+def rank_tasks(
+    projects: dict[str, Project], tasks: Iterable[Task], query: str
+) -> list[Task]:
+    """Returns tasks ordered from most to least relevant to `query`."""
+    query_stems = _stems(query)
+    today = date.today()
+    now = datetime.now(timezone.utc)
+    project_stems = {
+        project_id: _stems(project.name) for project_id, project in projects.items()
+    }
+
+    scored: list[tuple[float, int, Task]] = []
+    for position, task in enumerate(tasks):
+        score = 0.0
+        if query_stems:
+            score += 3.0 * len(query_stems & _stems(task.content))
+            score += 2.0 * len(query_stems & project_stems.get(task.project_id, set()))
+        score += _due_score(task, today)
+        score += _recency_score(task, now)
+        project = projects.get(task.project_id)
+        if project is not None and project.is_favorite:
+            score += 0.5
+        scored.append((-score, position, task))
+    scored.sort(key=lambda entry: (entry[0], entry[1]))
+    return [task for _, _, task in scored]
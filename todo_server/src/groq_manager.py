@@ -3,6 +3,7 @@ Manages interactions with the Groq API, specifically for audio transcription.
 """
 
 import os
+from typing import BinaryIO
 from groq import AsyncGroq
 from dotenv import load_dotenv
 
@@ -27,12 +28,21 @@ class GroqManager:
         self._transcription_model: str = "whisper-large-v3"
 
     async def transcribe_audio(
-        self, audio_bytes: bytes, file_format: str = "wav"
+        self, audio: bytes | BinaryIO, file_format: str = "wav"
     ) -> str:
+        """
+        `audio` may be a file object positioned at the start, which is
+        streamed into the upload instead of being read into memory.
+        """
+        if isinstance(audio, bytes):
+            n_bytes = len(audio)
+        else:
+            n_bytes = audio.seek(0, os.SEEK_END)
+            _ = audio.seek(0)
         print(
-            f"Transcribing {len(audio_bytes)} bytes of audio using Groq ({self._transcription_model})..."
+            f"Transcribing {n_bytes} bytes of audio using Groq ({self._transcription_model})..."
         )
-        file_tuple = (f"audio.{file_format}", audio_bytes, f"audio/{file_format}")
+        file_tuple = (f"audio.{file_format}", audio, f"audio/{file_format}")
 
         try:
             transcription = await self._client.audio.transcriptions.create(
@@ -0,0 +1,107 @@
+"""
+Conversation history with a token budget, so that the prompt size of a turn
+does not grow with the length of the session.
+"""
+
+from dataclasses import dataclass
+from typing import final
+
+from openai.types.chat import ChatCompletionMessageParam
+
+from src.context_selector import estimate_tokens
+
+
+def _trim(text: str, limit: int) -> str:
+    text = text.strip()
+    if len(text) <= limit:
+        return text
+    return text[:limit].rstrip() + f"\n... [{len(text) - limit} more characters trimmed]"
+
+
+def _one_line(text: str, limit: int = 200) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[:limit] + "..."
+
+
+@dataclass
+class Turn:
+    transcription: str
+    code: str
+    exec_result: str
+    answer: str
+
+
+@final
+class HistoryManager:
+    """
+    Keeps the most recent turns verbatim (with code and output trimmed) while
+    they fit into `token_budget`. Older turns are compacted into one summary
+    message with just the request and the answer, and dropped entirely past
+    `max_summarized` turns.
+    """
+
+    def __init__(
+        self,
+        token_budget: int = 3000,
+        max_block_chars: int = 1500,
+        max_summarized: int = 10,
+    ):
+        self.token_budget = token_budget
+        self.max_block_chars = max_block_chars
+        self.max_summarized = max_summarized
+        self._recent: list[tuple[Turn, list[ChatCompletionMessageParam], int]] = []
+        self._summarized: list[str] = []
+
+    def __len__(self) -> int:
+        return len(self._summarized) + len(self._recent)
+
+    def _render(self, turn: Turn) -> list[ChatCompletionMessageParam]:
+        limit = self.max_block_chars
+        request = f"""<user_request_history>
+{turn.transcription}
+</user_request_history>"""
+        combined_message = f"""<code_history>
+{_trim(turn.code, limit)}
+</code_history>
+<output_history>
+{_trim(turn.exec_result, limit)}
+</output_history>
+<answer_history>
+{_trim(turn.answer, limit)}
+</answer_history>"""
+        return [
+            {"content": request, "role": "user"},
+            {"content": combined_message, "role": "assistant"},
+        ]
+
+    def add(self, transcription: str, code: str, exec_result: str, answer: str):
+        turn = Turn(transcription, code, exec_result, answer)
+        messages = self._render(turn)
+        tokens = sum(estimate_tokens(str(m["content"])) for m in messages)
+        self._recent.append((turn, messages, tokens))
+        self._compact()
+
+    def _compact(self):
+        total = sum(tokens for _, _, tokens in self._recent)
+        # Always keep the latest turn verbatim, it is what follow-ups refer to
+        while len(self._recent) > 1 and total > self.token_budget:
+            turn, _, tokens = self._recent.pop(0)
+            total -= tokens
+            self._summarized.append(
+                f"- {_one_line(turn.transcription)} -> {_one_line(turn.answer)}"
+            )
+        if len(self._summarized) > self.max_summarized:
+            del self._summarized[: len(self._summarized) - self.max_summarized]
+
+    def messages(self) -> list[ChatCompletionMessageParam]:
+        result: list[ChatCompletionMessageParam] = []
+        if self._summarized:
+            summary = "\n".join(self._summarized)
+            content = f"""<earlier_requests_history>
+{summary}
+</earlier_requests_history>"""
+            result.append({"content": content, "role": "user"})
+            result.append({"content": "OK", "role": "assistant"})
+        for _, messages, _ in self._recent:
+            result.extend(messages)
+        return result
@@ -1,10 +1,21 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.responses import JSONResponse
+from src.services import Services
 from src.websocket import websocket_endpoint  
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    services = Services()
+    app.state.services = services
+    services.start()
+    yield
+    await services.aclose()
+
 
 app = FastAPI(
+    lifespan=lifespan,
     title="Todoist AI Server",
     description="A server that converts user queries to Todoist tasks.",
     version="0.1.0",
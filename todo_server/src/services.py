@@ -0,0 +1,44 @@
+"""
+Clients shared by every websocket session of the process.
+"""
+
+import os
+from typing import final
+
+from src.ai_manager import AiManager
+from src.code_cache import CodeCache
+from src.code_manager import CodeManager
+from src.groq_manager import GroqManager
+from src.task_client import TaskClient
+from src.todoist_manager import TodoistManagerSyncEndpoint
+from src.tts_manager import TTSManager
+
+
+@final
+class Services:
+    """
+    Created once in the application lifespan so that sessions reuse the same
+    HTTP connection pools and the already loaded sync cache.
+    """
+
+    def __init__(self):
+        self.groq_manager = GroqManager()
+        # Set when running several uvicorn workers, so they share one sync loop
+        shared_store = os.getenv("TODOIST_SHARED_STORE", "false").lower() == "true"
+        self.todoist_manager_se = TodoistManagerSyncEndpoint(shared=shared_store)
+        # Hedged model requests cut tail latency but may be billed twice
+        hedging = os.getenv("AI_HEDGING", "false").lower() == "true"
+        self.ai_manager = AiManager(hedging=hedging)
+        self.code_manager = CodeManager()
+        self.code_cache = CodeCache()
+        self.tts_manager = TTSManager()
+        self.task_client = TaskClient(self.todoist_manager_se)
+
+    def start(self):
+        self.todoist_manager_se.start()
+        self.code_manager.start()
+
+    async def aclose(self):
+        await self.code_manager.aclose()
+        await self.todoist_manager_se.aclose()
+        await self.ai_manager.aclose()
@@ -0,0 +1,72 @@
+"""
+Coordination between server processes that share one sync store.
+
+One process holds the leader lock, syncs with Todoist and publishes the
+snapshot; the others map the published snapshot and reload it when its
+version changes. Writers in other processes ask the leader to sync early
+by touching a request file.
+"""
+
+import fcntl
+import os
+import time
+from typing import final
+
+SnapshotVersion = tuple[int, int, int]
+
+
+def snapshot_version(path: str) -> SnapshotVersion | None:
+    """Snapshots are replaced atomically, so a new inode means a new version."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+def request_sync(path: str):
+    with open(path, "a"):
+        pass
+    os.utime(path)
+
+
+def sync_requested_since(path: str, since: float) -> bool:
+    """`since` is a time.time() timestamp."""
+    try:
+        return os.stat(path).st_mtime > since
+    except FileNotFoundError:
+        return False
+
+
+@final
+class LeaderLock:
+    """A non-blocking exclusive flock, released when the process exits."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd: int | None = None
+
+    @property
+    def held(self) -> bool:
+        return self._fd is not None
+
+    def try_acquire(self) -> bool:
+        if self._fd is not None:
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        _ = os.write(fd, f"{os.getpid()} {time.time()}\n".encode())
+        self._fd = fd
+        return True
+
+    def release(self):
+        if self._fd is None:
+            return
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+        os.close(self._fd)
+        self._fd = None
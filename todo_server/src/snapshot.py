@@ -0,0 +1,178 @@
+"""
+Binary snapshot of the sync cache for fast cold starts.
+
+Layout (little endian):
+
+    magic "TDSN" | version u32 | crc32(body) u32 | body
+
+    body: token | n_projects u32 | n_items u32
+          | n_projects + n_items entries | records
+
+    entry: id | project_id | due day ordinal i32 (0 = no due) | offset u64 | length u32
+
+Strings are u32 length-prefixed UTF-8. Records are raw Sync API JSON
+objects located by offset/length inside the body, so a record is only decoded
+when it is accessed. Entries carry what the indexes need without decoding.
+"""
+
+import json
+import mmap
+import os
+import struct
+import zlib
+from collections.abc import Callable, Iterator, MutableMapping
+from dataclasses import dataclass
+from datetime import date
+from typing import Any, TypeVar, final
+
+MAGIC = b"TDSN"
+VERSION = 1
+
+_HEADER = struct.Struct("<4sII")
+_U32 = struct.Struct("<I")
+_ENTRY_TAIL = struct.Struct("<iQI")
+
+T = TypeVar("T")
+
+
+def raw_due_day(raw: dict[str, Any]) -> date | None:
+    due = raw.get("due")
+    if not due or not due.get("date"):
+        return None
+    return date.fromisoformat(due["date"][:10])
+
+
+@dataclass(frozen=True)
+class SnapshotEntry:
+    id: str
+    project_id: str
+    due_day: date | None
+    offset: int
+    length: int
+
+
+def _pack_str(value: str) -> bytes:
+    encoded = value.encode()
+    return _U32.pack(len(encoded)) + encoded
+
+
+def write_snapshot(
+    path: str,
+    sync_token: str,
+    projects: list[dict[str, Any]],
+    items: list[dict[str, Any]],
+):
+    """Writes a snapshot atomically (temp file + rename). Blocking."""
+    records = [json.dumps(raw).encode() for raw in [*projects, *items]]
+    entries_size = 0
+    entry_heads: list[bytes] = []
+    for i, raw in enumerate([*projects, *items]):
+        is_item = i >= len(projects)
+        due_day = raw_due_day(raw) if is_item else None
+        head = _pack_str(raw["id"]) + _pack_str(raw["project_id"] if is_item else "")
+        due_ordinal = due_day.toordinal() if due_day else 0
+        entry_heads.append(head + struct.pack("<i", due_ordinal))
+        entries_size += len(entry_heads[-1]) + 12
+
+    prefix = _pack_str(sync_token) + _U32.pack(len(projects)) + _U32.pack(len(items))
+    offset = len(prefix) + entries_size
+    parts = [prefix]
+    for head, record in zip(entry_heads, records):
+        parts.append(head + struct.pack("<QI", offset, len(record)))
+        offset += len(record)
+    parts.extend(records)
+    body = b"".join(parts)
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        _ = f.write(_HEADER.pack(MAGIC, VERSION, zlib.crc32(body)))
+        _ = f.write(body)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+@final
+class Snapshot:
+    """A memory-mapped snapshot. Raises ValueError if the file is not valid."""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._mmap) < _HEADER.size:
+            raise ValueError("Snapshot is truncated")
+        magic, version, checksum = _HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Unsupported snapshot {magic!r} v{version}")
+        self._body = memoryview(self._mmap)[_HEADER.size :]
+        if zlib.crc32(self._body) != checksum:
+            raise ValueError("Snapshot checksum mismatch")
+
+        self.sync_token, pos = self._read_str(0)
+        n_projects, n_items = struct.unpack_from("<II", self._body, pos)
+        pos += 8
+        entries: list[SnapshotEntry] = []
+        for _ in range(n_projects + n_items):
+            record_id, pos = self._read_str(pos)
+            project_id, pos = self._read_str(pos)
+            due_ordinal, offset, length = _ENTRY_TAIL.unpack_from(self._body, pos)
+            pos += _ENTRY_TAIL.size
+            due_day = date.fromordinal(due_ordinal) if due_ordinal else None
+            entries.append(
+                SnapshotEntry(record_id, project_id, due_day, offset, length)
+            )
+        self.projects = entries[:n_projects]
+        self.items = entries[n_projects:]
+
+    def _read_str(self, pos: int) -> tuple[str, int]:
+        (length,) = _U32.unpack_from(self._body, pos)
+        start = pos + _U32.size
+        return bytes(self._body[start : start + length]).decode(), start + length
+
+    def record(self, entry: SnapshotEntry) -> dict[str, Any]:
+        return json.loads(bytes(self._body[entry.offset : entry.offset + entry.length]))
+
+
+class _Pending:
+    __slots__ = ("entry",)
+
+    def __init__(self, entry: SnapshotEntry):
+        self.entry = entry
+
+
+@final
+class LazyRecordMap(MutableMapping[str, T]):
+    """
+    An insertion-ordered id -> object map whose values may still be
+    undecoded snapshot records; each one is built on first access.
+    """
+
+    def __init__(self, snapshot: Snapshot, factory: Callable[[dict[str, Any]], T]):
+        self._snapshot = snapshot
+        self._factory = factory
+        self._values: dict[str, T | _Pending] = {}
+
+    def add_pending(self, entry: SnapshotEntry):
+        self._values[entry.id] = _Pending(entry)
+
+    def __getitem__(self, key: str) -> T:
+        value = self._values[key]
+        if isinstance(value, _Pending):
+            value = self._factory(self._snapshot.record(value.entry))
+            self._values[key] = value
+        return value
+
+    def __setitem__(self, key: str, value: T):
+        self._values[key] = value
+
+    def __delitem__(self, key: str):
+        del self._values[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._values)
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._values
@@ -0,0 +1,112 @@
+"""
+SQLite-backed persistence for the Todoist sync cache.
+
+Each sync delta is written as one transaction that upserts or deletes only the
+records it contains and updates the sync token, so the token on disk always
+matches the stored data.
+"""
+
+import json
+import sqlite3
+import threading
+from typing import Any, final
+
+
+def is_project_tombstone(raw: dict[str, Any]) -> bool:
+    return bool(raw.get("is_deleted"))
+
+
+def is_item_tombstone(raw: dict[str, Any]) -> bool:
+    # The Sync API reports deletions and completions as flags on the record
+    return bool(raw.get("is_deleted") or raw.get("checked"))
+
+
+@final
+class SyncStore:
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            _ = self._conn.execute("PRAGMA journal_mode=WAL")
+            _ = self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)"
+            )
+            _ = self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS projects (id TEXT PRIMARY KEY, data TEXT)"
+            )
+            _ = self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS items (id TEXT PRIMARY KEY, data TEXT)"
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def sync_token(self) -> str:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM meta WHERE key = 'sync_token'"
+            ).fetchone()
+        return row[0] if row else "*"
+
+    def load(self) -> tuple[str, list[dict[str, Any]], list[dict[str, Any]]]:
+        """Returns the sync token ("*" if unknown) and the stored raw records."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM meta WHERE key = 'sync_token'"
+            ).fetchone()
+            projects = [
+                json.loads(data)
+                for (data,) in self._conn.execute(
+                    "SELECT data FROM projects ORDER BY rowid"
+                )
+            ]
+            items = [
+                json.loads(data)
+                for (data,) in self._conn.execute("SELECT data FROM items ORDER BY rowid")
+            ]
+        return (row[0] if row else "*"), projects, items
+
+    def write(
+        self,
+        sync_token: str,
+        projects: list[dict[str, Any]],
+        items: list[dict[str, Any]],
+        full_sync: bool = False,
+    ):
+        """Applies one sync response. Blocking; call it off the event loop."""
+        with self._lock, self._conn:
+            if full_sync:
+                _ = self._conn.execute("DELETE FROM projects")
+                _ = self._conn.execute("DELETE FROM items")
+            self._apply(
+                "projects",
+                [(p["id"], p) for p in projects if not is_project_tombstone(p)],
+                [p["id"] for p in projects if is_project_tombstone(p)],
+            )
+            self._apply(
+                "items",
+                [(i["id"], i) for i in items if not is_item_tombstone(i)],
+                [i["id"] for i in items if is_item_tombstone(i)],
+            )
+            _ = self._conn.execute(
+                "INSERT INTO meta (key, value) VALUES ('sync_token', ?) "
+                + "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                (sync_token,),
+            )
+
+    def _apply(
+        self,
+        table: str,
+        upserts: list[tuple[str, dict[str, Any]]],
+        deletes: list[str],
+    ):
+        # Upsert instead of REPLACE keeps the rowid, and with it the load order
+        _ = self._conn.executemany(
+            f"INSERT INTO {table} (id, data) VALUES (?, ?) "
+            + "ON CONFLICT(id) DO UPDATE SET data = excluded.data",
+            [(record_id, json.dumps(raw)) for record_id, raw in upserts],
+        )
+        _ = self._conn.executemany(
+            f"DELETE FROM {table} WHERE id = ?", [(record_id,) for record_id in deletes]
+        )
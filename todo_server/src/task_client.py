@@ -1,6 +1,9 @@
-from dataclasses import dataclass
-from datetime import date, datetime, timedelta
-from typing import final
+import copy
+import uuid
+from collections import Counter
+from dataclasses import dataclass, replace
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, final
 from dotenv import load_dotenv
 import os
 from loguru import logger
@@ -49,6 +52,84 @@ class TaskClient:
         self.todoist = TodoistAPI(token)
 
         self.todoist_ro = todoist_ro_client
+        self._code_info: str | None = None
+        # Queued Sync API commands, None unless this is a batching client
+        self._commands: list[dict[str, Any]] | None = None
+        self._temp_ids: dict[str, str] = {}
+        # Real id -> temp id, so that objects read back match the ones returned
+        # before the flush
+        self._script_ids: dict[str, str] = {}
+        # Command type -> number of commands Todoist accepted
+        self.committed: Counter[str] = Counter()
+
+    def batched(self) -> "TaskClient":
+        """
+        Returns a client that queues writes instead of calling the REST API.
+        Queued writes are sent as one Sync API request by flush(); objects
+        returned meanwhile carry temp ids, which later calls can still use.
+        """
+        client = copy.copy(self)
+        client._commands = []
+        client._temp_ids = {}
+        client._script_ids = {}
+        client.committed = Counter()
+        return client
+
+    @property
+    def is_batching(self) -> bool:
+        return self._commands is not None
+
+    def has_pending_writes(self) -> bool:
+        return bool(self._commands)
+
+    async def flush(self):
+        if not self._commands:
+            return
+        commands, self._commands = self._commands, []
+        logger.info(f"Flushing {len(commands)} queued Todoist commands")
+        try:
+            mapping = await self.todoist_ro.commit(commands)
+        except BaseException:
+            # Command uuids make a retry idempotent for the ones that went through
+            self._commands = commands + self._commands
+            raise
+        self._temp_ids.update(mapping)
+        self._script_ids.update((real, temp) for temp, real in mapping.items())
+        self.committed.update(command["type"] for command in commands)
+
+    def _resolve(self, id: str) -> str:
+        return self._temp_ids.get(id, id)
+
+    def _script_id(self, id: str) -> str:
+        return self._script_ids.get(id, id)
+
+    def _resolve_filter(self, filter: Filter) -> Filter:
+        if isinstance(filter, FilterProjectId):
+            return replace(filter, id=self._resolve(filter.id))
+        if isinstance(filter, (FilterAND, FilterOR)):
+            return replace(
+                filter, filters=[self._resolve_filter(f) for f in filter.filters]
+            )
+        return filter
+
+    def _queue(self, command_type: str, args: dict[str, Any]) -> str:
+        assert self._commands is not None
+        temp_id = str(uuid.uuid4())
+        self._commands.append(
+            {
+                "type": command_type,
+                "uuid": str(uuid.uuid4()),
+                "temp_id": temp_id,
+                "args": args,
+            }
+        )
+        return temp_id
+
+    def _inbox_project_id(self) -> str:
+        for project in self.todoist_ro.get_projects():
+            if project.is_inbox_project:
+                return project.id
+        return ""
 
     @staticmethod
     def get_date_cls() -> type[date]:
@@ -69,33 +150,46 @@ class TaskClient:
         return datetime
 
     def get_project_by_id(self, id: str) -> Project:
-        project = self.todoist_ro.get_project(id)
+        project = self.todoist_ro.get_project(self._resolve(id))
         return Project(
-            id=project.id, name=project.name, is_favorite=project.is_favorite
+            id=self._script_id(project.id),
+            name=project.name,
+            is_favorite=project.is_favorite,
         )
 
     def get_all_projects(self) -> list[Project]:
         projects = self.todoist_ro.get_projects()
         return [
-            Project(id=project.id, name=project.name, is_favorite=project.is_favorite)
+            Project(
+                id=self._script_id(project.id),
+                name=project.name,
+                is_favorite=project.is_favorite,
+            )
             for project in projects
         ]
 
     def add_project(self, name: str, is_favorite: bool = False) -> Project:
+        if self.is_batching:
+            args = {"name": name, "is_favorite": is_favorite}
+            temp_id = self._queue("project_add", args)
+            return Project(id=temp_id, name=name, is_favorite=is_favorite)
         project = self.todoist.add_project(name, is_favorite=is_favorite)
         return Project(
             id=project.id, name=project.name, is_favorite=project.is_favorite
         )
 
     def remove_project(self, id: str) -> bool:
+        if self.is_batching:
+            _ = self._queue("project_delete", {"id": self._resolve(id)})
+            return True
         return self.todoist.delete_project(id)
 
     def _convert_to_local_task(self, task: TodoistTask) -> Task:
         """Converts a Todoist API Task object to the local Task dataclass."""
         return Task(
-            id=task.id,
+            id=self._script_id(task.id),
             content=task.content,
-            project_id=task.project_id,
+            project_id=self._script_id(task.project_id),
             priority=task.priority,
             due=task.due.date if task.due else None,
             # due_date=task.due.date if task.due and isinstance(task.due.date, date) and not isinstance(task.due.date, datetime) else None,
@@ -103,6 +197,8 @@ class TaskClient:
         )
 
     def get_tasks(self, filter: Filter | None = None) -> list[Task]:
+        if filter is not None:
+            filter = self._resolve_filter(filter)
         tasks = self.todoist_ro.get_tasks(filter)
         return [self._convert_to_local_task(task) for task in tasks]
 
@@ -114,6 +210,10 @@ class TaskClient:
         due_datetime: datetime | None = None,
         priority: int | None = None,
     ) -> Task:
+        if self.is_batching:
+            return self._queue_add_task(
+                content, project_id, due_date, due_datetime, priority
+            )
         task = self.todoist.add_task(
             content,
             project_id=project_id,
@@ -123,7 +223,43 @@ class TaskClient:
         )
         return self._convert_to_local_task(task)
 
+    def _queue_add_task(
+        self,
+        content: str,
+        project_id: str | None,
+        due_date: date | None,
+        due_datetime: datetime | None,
+        priority: int | None,
+    ) -> Task:
+        args: dict[str, Any] = {"content": content}
+        if project_id is not None:
+            args["project_id"] = self._resolve(project_id)
+        if priority is not None:
+            args["priority"] = priority
+        due: date | datetime | None = None
+        if due_datetime is not None:
+            due = due_datetime
+            if due_datetime.tzinfo is not None:
+                utc = due_datetime.astimezone(timezone.utc).replace(tzinfo=None)
+                args["due"] = {"date": utc.isoformat(timespec="seconds") + "Z"}
+            else:
+                args["due"] = {"date": due_datetime.isoformat(timespec="seconds")}
+        elif due_date is not None:
+            due = due_date
+            args["due"] = {"date": due_date.isoformat()}
+        temp_id = self._queue("item_add", args)
+        return Task(
+            id=temp_id,
+            content=content,
+            project_id=project_id or self._inbox_project_id(),
+            priority=priority or 1,
+            due=due,
+        )
+
     def complete_task(self, task_id: str) -> bool:
+        if self.is_batching:
+            _ = self._queue("item_close", {"id": self._resolve(task_id)})
+            return True
         return self.todoist.complete_task(task_id)
 
     def _get_class_fields_info(self, cls: type) -> list[str]:
@@ -152,13 +288,28 @@ class TaskClient:
             logger.error(f"Could not inspect {cls.__name__} fields: {e}")
         return result
 
-    def get_code_info(self):
+    def get_code_info(self) -> str:
+        # The spec only depends on source code, and must stay byte-identical
+        # between requests for the prompt prefix to be cacheable
+        if self._code_info is None:
+            self._code_info = self._build_code_info()
+        return self._code_info
+
+    def _build_code_info(self):
         client = TaskClient
         ignore = [
             "__init__",
             "__exit__",
             "__enter__",
             "get_code_info",
+            "_build_code_info",
+            "batched",
+            "has_pending_writes",
+            "flush",
+            "_resolve",
+            "_queue",
+            "_queue_add_task",
+            "_inbox_project_id",
             "_get_class_fields_info",
         ]
         result = ["class TasksAPI:"]
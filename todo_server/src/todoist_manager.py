@@ -1,24 +1,56 @@
-from typing import Any, final
+from typing import Any, Callable, Iterable, MutableMapping, final
 from todoist_api_python.api import TodoistAPI
 from todoist_api_python.api_async import TodoistAPIAsync
 
-from todoist_api_python.models import ApiDue, Task, Project
+from todoist_api_python.models import Task, Project
 
 
 from dotenv import load_dotenv
 import os
 import asyncio
+import time
 from datetime import date, datetime
 import httpx
 import json
 from loguru import logger
 import operator
+import struct
+from bisect import bisect_left, bisect_right, insort
 from dataclass_wizard import JSONPyWizard
 from dataclasses import dataclass
 
+from src.context_selector import estimate_tokens, rank_tasks
+from src.shared_store import (
+    LeaderLock,
+    SnapshotVersion,
+    request_sync,
+    snapshot_version,
+    sync_requested_since,
+)
+from src.snapshot import LazyRecordMap, Snapshot, write_snapshot
+from src.sync_store import SyncStore, is_item_tombstone, is_project_tombstone
+
 _ = load_dotenv()
 
 
+def _format_task_line(task: Task, today: date) -> str:
+    due_str = ""
+    if task.due:
+        due = task.due.date
+        try:
+            if due == today:
+                due_str = " [today]"
+            else:
+                due_str = f" [{due.strftime('%d %b %Y')}]"
+        except ValueError:
+            logger.warning(
+                f"Failed to parse due date '{date}' for task '{task.content}'. Using original string."
+            )
+            due_str = f" [{task.due.string}]"  # Fallback to original string
+
+    return f" - {task.content}{due_str}"
+
+
 def format_context(projects: list[Project], tasks: list[Task]) -> str:
     project_map: dict[str, str] = {project.id: project.name for project in projects}
 
@@ -30,22 +62,7 @@ def format_context(projects: list[Project], tasks: list[Task]) -> str:
         if project_id not in tasks_by_project:
             tasks_by_project[project_id] = []
 
-        due_str = ""
-        if task.due:
-            due = task.due.date
-            try:
-                if due == today:
-                    due_str = " [today]"
-                else:
-                    due_str = f" [{due.strftime('%d %b %Y')}]"
-            except ValueError:
-                logger.warning(
-                    f"Failed to parse due date '{date}' for task '{task.content}'. Using original string."
-                )
-                due_str = f" [{task.due.string}]"  # Fallback to original string
-
-        task_line = f" - {task.content}{due_str}"
-        tasks_by_project[project_id].append(task_line)
+        tasks_by_project[project_id].append(_format_task_line(task, today))
 
     output_lines: list[str] = []
     # Sort projects by name for consistent output
@@ -63,6 +80,146 @@ def format_context(projects: list[Project], tasks: list[Task]) -> str:
     return "\n".join(output_lines)
 
 
+@final
+class ContextCache:
+    """
+    Renders the same text as format_context, but keeps one rendered block per
+    project and only re-renders projects invalidated since the last call.
+    """
+
+    def __init__(self):
+        self._blocks: dict[str, str] = {}
+        self._names: dict[str, str] = {}
+        self._text: str | None = None
+        self._day: date | None = None
+        # None means everything has to be re-rendered
+        self._dirty: set[str] | None = None
+
+    def invalidate(self, project_ids: set[str]):
+        if self._dirty is not None:
+            self._dirty.update(project_ids)
+
+    def invalidate_all(self):
+        self._dirty = None
+
+    def render(self, projects: Iterable[Project], tasks: Iterable[Task]) -> str:
+        today = date.today()
+        if today != self._day:
+            # "[today]" markers depend on the current date
+            self._day = today
+            self._dirty = None
+        if self._text is not None and self._dirty is not None and not self._dirty:
+            return self._text
+
+        dirty = self._dirty
+        if dirty is None:
+            self._blocks.clear()
+        for project_id in dirty or ():
+            _ = self._blocks.pop(project_id, None)
+        self._names = {project.id: project.name for project in projects}
+
+        lines_by_project: dict[str, list[str]] = {}
+        for task in tasks:
+            if dirty is not None and task.project_id not in dirty:
+                continue
+            lines_by_project.setdefault(task.project_id, []).append(
+                _format_task_line(task, today)
+            )
+        for project_id, task_lines in lines_by_project.items():
+            project_name = self._names.get(project_id, "Unknown Project")
+            self._blocks[project_id] = "\n".join([project_name, *task_lines])
+
+        # Sort projects by name for consistent output
+        sorted_project_ids = sorted(
+            self._blocks.keys(), key=lambda pid: (self._names.get(pid, ""), pid)
+        )
+        self._text = "\n".join(self._blocks[pid] for pid in sorted_project_ids)
+        self._dirty = set()
+        return self._text
+
+
+def _due_day(task: Task) -> date | None:
+    if not task.due:
+        return None
+    due = task.due.date
+    return due.date() if isinstance(due, datetime) else due
+
+
+@final
+class TaskIndex:
+    """Secondary indexes over the task store, maintained as deltas are applied."""
+
+    def __init__(self):
+        self._task_ids_by_project: dict[str, dict[str, None]] = {}
+        # task id -> (project id, due day), used to undo an entry on removal
+        self._entries: dict[str, tuple[str, date | None]] = {}
+        # Several projects may share a name; the most recently added one wins
+        self._project_ids_by_name: dict[str, dict[str, None]] = {}
+        self._due: list[tuple[date, str]] = []
+
+    def clear(self):
+        self._task_ids_by_project.clear()
+        self._entries.clear()
+        self._project_ids_by_name.clear()
+        self._due.clear()
+
+    def add_project(self, project: Project):
+        ids = self._project_ids_by_name.setdefault(project.name, {})
+        _ = ids.pop(project.id, None)
+        ids[project.id] = None
+
+    def remove_project(self, project: Project):
+        ids = self._project_ids_by_name.get(project.name)
+        if ids is None:
+            return
+        _ = ids.pop(project.id, None)
+        if not ids:
+            del self._project_ids_by_name[project.name]
+
+    def add_task(self, task_id: str, project_id: str, due_day: date | None):
+        self.remove_task(task_id)
+        self._entries[task_id] = (project_id, due_day)
+        self._task_ids_by_project.setdefault(project_id, {})[task_id] = None
+        if due_day is not None:
+            insort(self._due, (due_day, task_id))
+
+    def remove_task(self, task_id: str):
+        entry = self._entries.pop(task_id, None)
+        if entry is None:
+            return
+        project_id, due_day = entry
+        task_ids = self._task_ids_by_project.get(project_id)
+        if task_ids is not None:
+            _ = task_ids.pop(task_id, None)
+            if not task_ids:
+                del self._task_ids_by_project[project_id]
+        if due_day is not None:
+            i = bisect_left(self._due, (due_day, task_id))
+            if i < len(self._due) and self._due[i] == (due_day, task_id):
+                del self._due[i]
+
+    def project_id(self, name: str) -> str | None:
+        ids = self._project_ids_by_name.get(name)
+        return next(reversed(ids)) if ids else None
+
+    def project_of(self, task_id: str) -> str | None:
+        entry = self._entries.get(task_id)
+        return entry[0] if entry else None
+
+    def task_ids_in_project(self, project_id: str) -> list[str]:
+        return list(self._task_ids_by_project.get(project_id, {}))
+
+    def task_ids_due(self, first: date | None, last: date | None) -> list[str]:
+        """Ids of tasks due between `first` and `last` days, both inclusive."""
+        lo = 0 if first is None else bisect_left(self._due, (first, ""))
+        hi = (
+            len(self._due)
+            if last is None
+            else bisect_right(self._due, (last, chr(0x10FFFF)))
+        )
+        return [task_id for _, task_id in self._due[lo:hi]]
+
+
 @dataclass
 class FilterProjectId:
     id: str
@@ -115,64 +272,394 @@ class SyncEndpointResponse(JSONPyWizard):
     sync_token: str
 
 
+def _never(task: Task) -> bool:
+    return False
+
+
+def _always(task: Task) -> bool:
+    return True
+
+
+def _flatten(filter_obj: "FilterAND | FilterOR") -> list["Filter"]:
+    """Inlines nested filters of the same kind, e.g. AND(a, AND(b, c)) -> [a, b, c]."""
+    result: list[Filter] = []
+    for f in filter_obj.filters:
+        if type(f) is type(filter_obj):
+            result.extend(_flatten(f))
+        else:
+            result.append(f)
+    return result
+
+
+def _compile_due(filter_obj: "FilterTaskDue") -> Callable[[Task], bool]:
+    bounds = [
+        (operator.eq, filter_obj.on),
+        (operator.lt, filter_obj.before),
+        (operator.gt, filter_obj.after),
+    ]
+    # Each bound keeps its exact value and its day, as mixed date/datetime
+    # comparisons fall back to comparing days
+    checks = [
+        (op, value, value.date() if isinstance(value, datetime) else value)
+        for op, value in bounds
+        if value
+    ]
+    if not checks:
+        return _never
+
+    def matches(task: Task) -> bool:
+        if not task.due:
+            return False
+        due = task.due.date
+        due_day = due.date() if isinstance(due, datetime) else due
+        for op, value, day in checks:
+            if type(due) is type(value):
+                if not op(due, value):
+                    return False
+            elif not op(due_day, day):
+                return False
+        return True
+
+    return matches
+
+
+@dataclass
+class _LoadedSnapshot:
+    sync_token: str
+    version: SnapshotVersion | None
+    projects: dict[str, Project]
+    items: LazyRecordMap[Task]
+    index: TaskIndex
+
+
 @final
 class TodoistManagerSyncEndpoint:
-    def __init__(self):
+    def __init__(
+        self,
+        sync_interval: float = 30.0,
+        max_staleness: float = 60.0,
+        context_token_budget: int = 6000,
+        shared: bool = False,
+        refresh_interval: float = 1.0,
+    ):
+        """
+        `sync_interval` is the pause between background syncs, `max_staleness`
+        is how old the local store may be before refresh() syncs inline.
+        `context_token_budget` caps the task overview built by select_context.
+
+        With `shared`, several server processes use one store: the process
+        holding the leader lock syncs and publishes snapshots, the others
+        check for a new snapshot every `refresh_interval` seconds and take
+        over when the leader exits.
+        """
         todoist_api_token = os.getenv("TODOIST_API_KEY")
         if not todoist_api_token:
             logger.error("TODOIST_API_KEY environment variable not set.")
             raise ValueError("TODOIST_API_KEY environment variable not set.")
         self._api_token = todoist_api_token
-        self._projects: list[Project] = []
-        self._items: list[Task] = []
+        # id-keyed maps are the primary store so deltas merge in O(len(delta))
+        self._projects: dict[str, Project] = {}
+        # May be a LazyRecordMap after a snapshot load, see _load_snapshot
+        self._items: MutableMapping[str, Task] = {}
+        self._index = TaskIndex()
+        self._context_cache = ContextCache()
+        self.shared = shared
+        self.refresh_interval = refresh_interval
+        app_data_dir = self._get_app_data_dir()
+        self._leader_lock = LeaderLock(os.path.join(app_data_dir, "sync.lock"))
+        self._sync_request_path = os.path.join(app_data_dir, "sync.request")
+        self._snapshot_version: SnapshotVersion | None = None
+        self._last_sync_time = 0.0
         self._load_cache()
         self._sync_url = "https://api.todoist.com/api/v1/sync"
-
-    def _get_sync_token_path(self) -> str:
-        xdg_data_home = os.getenv("XDG_DATA_HOME", os.path.expanduser("~/.local/share"))
-        app_data_dir = os.path.join(xdg_data_home, "todo_server")
-        os.makedirs(app_data_dir, exist_ok=True)
-        return os.path.join(app_data_dir, "sync_token")
-
-    def _get_data_cache_path(self) -> str:
+        # Shared by all sessions: one sync at a time keeps the sync token consistent
+        self._sync_lock = asyncio.Lock()
+        self.sync_interval = sync_interval
+        # Failed background syncs back off exponentially up to this many seconds
+        self.max_sync_backoff = 300.0
+        self.max_staleness = max_staleness
+        self.context_token_budget = context_token_budget
+        self._last_sync: float | None = None
+        self._http_client: httpx.AsyncClient | None = None
+        self._sync_task: asyncio.Task[None] | None = None
+
+    def _get_app_data_dir(self) -> str:
         xdg_data_home = os.getenv("XDG_DATA_HOME", os.path.expanduser("~/.local/share"))
         app_data_dir = os.path.join(xdg_data_home, "todo_server")
         os.makedirs(app_data_dir, exist_ok=True)
-        return os.path.join(app_data_dir, "sync_data.json")
+        return app_data_dir
 
-    def _load_cache(self):
-        self._sync_token_file = self._get_sync_token_path()
+    def _import_legacy_cache(self):
+        """Moves the old sync_token + sync_data.json cache into the SQLite store."""
+        app_data_dir = self._get_app_data_dir()
+        token_file = os.path.join(app_data_dir, "sync_token")
+        data_file = os.path.join(app_data_dir, "sync_data.json")
         try:
-            with open(self._sync_token_file, "r") as f:
+            with open(token_file, "r") as f:
                 token = f.read().strip()
-                self._sync_token = token if token else "*"
-        except FileNotFoundError:
-            self._sync_token = "*"  # Start with full sync
-
-        self._data_cache_file = self._get_data_cache_path()
-        try:
-            with open(self._data_cache_file, "r") as f:
+            with open(data_file, "r") as f:
                 data = json.load(f)
-                self._projects = [Project.from_dict(p) for p in data.get("projects", [])]
-                self._items = [Task.from_dict(t) for t in data.get("items", [])]
         except (FileNotFoundError, json.JSONDecodeError):
-            self._projects = []
-            self._items = []
-            self._sync_token = "*"  # if data is gone, we need a full sync
-
-    def _save_cache(self):
-        with open(self._sync_token_file, "w") as f:
-            _ = f.write(self._sync_token)
-
-        self._data_cache_file = self._get_data_cache_path()
-        with open(self._data_cache_file, "w") as f:
-            data = {
-                "projects": [p.to_dict() for p in self._projects],
-                "items": [t.to_dict() for t in self._items],
-            }
-            json.dump(data, f)
+            return
+        if not token:
+            return
+        logger.info("Importing legacy sync_data.json into the sync store")
+        self._store.write(
+            token, data.get("projects", []), data.get("items", []), full_sync=True
+        )
+
+    def _get_snapshot_path(self) -> str:
+        return os.path.join(self._get_app_data_dir(), "sync.snapshot")
+
+    def _load_snapshot(self) -> bool:
+        """
+        Loads the binary snapshot if it matches the SQLite store. Items stay
+        undecoded until accessed; the indexes are built from snapshot entries.
+        """
+        loaded = self._read_snapshot()
+        if loaded is None:
+            return False
+        self._install_snapshot(loaded)
+        return True
+
+    def _read_snapshot(self) -> _LoadedSnapshot | None:
+        """Builds a fresh store from the snapshot. Blocking, leaves self alone."""
+        version = snapshot_version(self._get_snapshot_path())
+        try:
+            snapshot = Snapshot(self._get_snapshot_path())
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, struct.error) as e:
+            logger.warning(f"Ignoring unreadable sync snapshot: {e}")
+            return None
+        if snapshot.sync_token != self._store.sync_token():
+            logger.info("Sync snapshot is stale, loading from the sync store")
+            return None
+
+        projects: dict[str, Project] = {}
+        index = TaskIndex()
+        for entry in snapshot.projects:
+            project = Project.from_dict(snapshot.record(entry))
+            projects[project.id] = project
+            index.add_project(project)
+        items: LazyRecordMap[Task] = LazyRecordMap(snapshot, Task.from_dict)
+        for entry in snapshot.items:
+            items.add_pending(entry)
+            index.add_task(entry.id, entry.project_id, entry.due_day)
+        return _LoadedSnapshot(snapshot.sync_token, version, projects, items, index)
+
+    def _install_snapshot(self, loaded: _LoadedSnapshot):
+        self._projects = loaded.projects
+        self._items = loaded.items
+        self._index = loaded.index
+        self._sync_token = loaded.sync_token
+        self._snapshot_version = loaded.version
+        logger.info(f"Loaded sync snapshot with {len(loaded.items)} items")
+
+    def _write_snapshot(self):
+        """Writes the current store contents as a snapshot. Blocking."""
+        sync_token, projects, items = self._store.load()
+        if sync_token == "*":
+            return
+        write_snapshot(self._get_snapshot_path(), sync_token, projects, items)
+
+    def _load_cache(self):
+        self._store = SyncStore(os.path.join(self._get_app_data_dir(), "sync.db"))
+        if self._load_snapshot():
+            return
+        self._sync_token, projects, items = self._store.load()
+        if self._sync_token == "*":
+            self._import_legacy_cache()
+            self._sync_token, projects, items = self._store.load()
+        self._clear_store()
+        for project in projects:
+            self._put_project(Project.from_dict(project))
+        for item in items:
+            self._put_item(Task.from_dict(item))
+
+    def _is_leader(self) -> bool:
+        return not self.shared or self._leader_lock.held
+
+    async def _refresh_from_snapshot(self):
+        """Picks up a snapshot published by the leader process."""
+        version = snapshot_version(self._get_snapshot_path())
+        if version is not None and version != self._snapshot_version:
+            # Held so that a commit's delta is not replaced by an older snapshot
+            async with self._sync_lock:
+                # Decoding projects and indexing every item is too slow for the loop
+                loaded = await asyncio.to_thread(self._read_snapshot)
+                if loaded is not None:
+                    self._install_snapshot(loaded)
+                    self._context_cache.invalidate_all()
+        # The leader keeps the snapshot current, so followers count as fresh
+        self._last_sync = time.monotonic()
+
+    def start(self):
+        """Starts keeping the local store warm in the background."""
+        if self._sync_task is None:
+            self._sync_task = asyncio.create_task(self._sync_loop())
+
+    async def aclose(self):
+        if self._sync_task is not None:
+            _ = self._sync_task.cancel()
+            try:
+                await self._sync_task
+            except asyncio.CancelledError:
+                pass
+            self._sync_task = None
+        if self._http_client is not None:
+            await self._http_client.aclose()
+            self._http_client = None
+        if self._is_leader():
+            try:
+                await asyncio.to_thread(self._write_snapshot)
+            except Exception as e:
+                logger.warning(f"Failed to write sync snapshot: {e}")
+        self._store.close()
+        self._leader_lock.release()
+
+    async def _sync_loop(self):
+        failures = 0
+        while True:
+            if self.shared and not self._leader_lock.held:
+                if not self._leader_lock.try_acquire():
+                    await self._refresh_from_snapshot()
+                    await asyncio.sleep(self.refresh_interval)
+                    continue
+                logger.info(f"Process {os.getpid()} became the sync leader")
+                # Deltas merged as a follower were never persisted
+                self._sync_token = self._store.sync_token()
+            try:
+                await self.sync()
+            except Exception as e:
+                # Todoist is down or rate limiting, do not hammer it
+                failures += 1
+                delay = min(self.sync_interval * 2**failures, self.max_sync_backoff)
+                logger.warning(f"Background sync failed, retrying in {delay:.0f}s: {e}")
+                await asyncio.sleep(delay)
+                continue
+            failures = 0
+            await self._wait_for_next_sync()
+
+    async def _wait_for_next_sync(self):
+        if not self.shared:
+            await asyncio.sleep(self.sync_interval)
+            return
+        # Followers that wrote to Todoist ask for an early sync
+        deadline = time.monotonic() + self.sync_interval
+        while time.monotonic() < deadline:
+            await asyncio.sleep(self.refresh_interval)
+            if sync_requested_since(self._sync_request_path, self._last_sync_time):
+                return
+
+    def _is_fresh(self) -> bool:
+        return (
+            self._last_sync is not None
+            and time.monotonic() - self._last_sync <= self.max_staleness
+        )
+
+    async def refresh(self):
+        """
+        Syncs unless the local copy is fresh enough. Never raises: when
+        Todoist is unreachable the stale local copy is still served.
+        """
+        if not self._is_fresh():
+            async with self._sync_lock:
+                # Another caller may have synced while we waited for the lock
+                if not self._is_fresh():
+                    try:
+                        _ = await self._sync()
+                    except Exception as e:
+                        logger.warning(f"Sync failed, using the local store: {e}")
 
     async def get_context(self) -> str:
+        await self.refresh()
+        return self._context_cache.render(
+            self._projects.values(), self._items.values()
+        )
+
+    def select_context(self, query: str) -> str:
+        """
+        Returns the task overview for a request, fitted into the token budget.
+        When everything fits the cached full overview is returned unchanged.
+        """
+        full = self._context_cache.render(
+            self._projects.values(), self._items.values()
+        )
+        if estimate_tokens(full) <= self.context_token_budget:
+            return full
+        return self._render_selected(query)
+
+    def _render_selected(self, query: str) -> str:
+        ranked = rank_tasks(self._projects, self._items.values(), query)
+        today = date.today()
+        # Leave room for the summary of omitted tasks
+        budget = int(self.context_token_budget * 0.9)
+        used = 0
+        shown: dict[str, list[str]] = {}
+        omitted: dict[str, int] = {}
+        for task in ranked:
+            line = _format_task_line(task, today)
+            cost = estimate_tokens(line)
+            if task.project_id not in shown:
+                project = self._projects.get(task.project_id)
+                cost += estimate_tokens(project.name if project else "Unknown Project")
+            if used + cost > budget:
+                omitted[task.project_id] = omitted.get(task.project_id, 0) + 1
+                continue
+            used += cost
+            shown.setdefault(task.project_id, []).append(line)
+
+        def project_name(project_id: str) -> str:
+            project = self._projects.get(project_id)
+            return project.name if project else "Unknown Project"
+
+        output_lines: list[str] = []
+        for project_id in sorted(shown, key=lambda pid: (project_name(pid), pid)):
+            output_lines.append(project_name(project_id))
+            output_lines.extend(shown[project_id])
+            if project_id in omitted:
+                output_lines.append(
+                    f" - ... and {omitted[project_id]} more tasks not shown"
+                )
+        hidden = sorted(
+            (project_name(pid), count)
+            for pid, count in omitted.items()
+            if pid not in shown
+        )
+        if hidden:
+            summary = ", ".join(f"{name} ({count})" for name, count in hidden)
+            output_lines.append(f"Projects not shown (number of tasks): {summary}")
+        return "\n".join(output_lines)
+
+    async def sync(self):
+        async with self._sync_lock:
+            _ = await self._sync()
+
+    async def commit(self, commands: list[dict[str, Any]]) -> dict[str, str]:
+        """
+        Sends write `commands` in one Sync API request. The response also
+        carries the delta since the last sync, which is merged right away.
+        Returns the temp_id -> id mapping, raises RuntimeError if Todoist
+        rejected any of the commands.
+        """
+        async with self._sync_lock:
+            result = await self._sync({"commands": json.dumps(commands)})
+        if not self._is_leader():
+            # Let the leader publish the change to the other processes
+            request_sync(self._sync_request_path)
+        statuses: dict[str, Any] = result.get("sync_status", {})
+        failed = {uuid: status for uuid, status in statuses.items() if status != "ok"}
+        if failed:
+            raise RuntimeError(
+                f"Todoist rejected {len(failed)} of {len(commands)} commands: {failed}"
+            )
+        return result.get("temp_id_mapping", {})
+
+    async def _sync(self, extra_data: dict[str, str] | None = None) -> dict[str, Any]:
+        started_at = time.time()
+        if self._http_client is None:
+            self._http_client = httpx.AsyncClient(timeout=10.0)
         headers = {
             "Authorization": f"Bearer {self._api_token}",
             "Content-Type": "application/x-www-form-urlencoded",
@@ -181,102 +668,214 @@ class TodoistManagerSyncEndpoint:
         data = {
             "sync_token": self._sync_token,
             "resource_types": json.dumps(["projects", "items"]),
+            **(extra_data or {}),
         }
 
-        async with httpx.AsyncClient() as client:
-            response = await client.post(self._sync_url, headers=headers, data=data)
+        response = await self._http_client.post(
+            self._sync_url, headers=headers, data=data
+        )
 
-        _ =response.raise_for_status()
+        _ = response.raise_for_status()
 
         result: dict[str, Any] = response.json()
 
+        # The token the store on disk is at, see the write below
+        previous_token = self._sync_token
         if "sync_token" in result:
             self._sync_token: str = result["sync_token"]
 
-        new_projects = [Project.from_dict(p) for p in result.get("projects", [])]
-        new_items = [Task.from_dict(t) for t in result.get("items", [])]
-
-        if result.get("full_sync"):
-            self._projects = new_projects
-            self._items = new_items
+        raw_projects: list[dict[str, Any]] = result.get("projects", [])
+        raw_items: list[dict[str, Any]] = result.get("items", [])
+        full_sync = bool(result.get("full_sync"))
+        if full_sync:
+            self._clear_store()
+            _ = self._apply_delta(raw_projects, raw_items)
+            self._context_cache.invalidate_all()
         else:
-            # Update projects
-            project_map = {p.id: p for p in self._projects}
-            for p in new_projects:
-                project_map[p.id] = p
-            self._projects = list(project_map.values())
-
-            # Update items
-            item_map = {i.id: i for i in self._items}
-            for i in new_items:
-                item_map[i.id] = i
-            self._items = list(item_map.values())
+            touched = self._apply_delta(raw_projects, raw_items)
+            self._context_cache.invalidate(touched)
 
-        self._save_cache()
+        self._last_sync = time.monotonic()
+        self._last_sync_time = started_at
+        if not self._is_leader():
+            # Followers keep their delta in memory, the leader persists it
+            return result
 
-        return format_context(self._projects, self._items)
+        # Only the records in this response are written, off the event loop
+        try:
+            await asyncio.to_thread(
+                self._store.write, self._sync_token, raw_projects, raw_items, full_sync
+            )
+        except Exception as e:
+            # Todoist has applied any commands already, so this is not an error
+            # for the caller. Asking from the persisted token again makes the
+            # next delta bring these records back for the store.
+            logger.warning(f"Failed to persist sync response: {e}")
+            self._sync_token = previous_token
+            return result
+        if full_sync or (self.shared and (raw_projects or raw_items)):
+            # Other processes only see changes through the snapshot
+            await asyncio.to_thread(self._write_snapshot)
+            self._snapshot_version = snapshot_version(self._get_snapshot_path())
+        return result
+
+    def _clear_store(self):
+        self._projects = {}
+        self._items = {}
+        self._index.clear()
+
+    def _put_project(self, project: Project):
+        old = self._projects.get(project.id)
+        if old is not None:
+            self._index.remove_project(old)
+        self._projects[project.id] = project
+        self._index.add_project(project)
+
+    def _drop_project(self, project_id: str):
+        old = self._projects.pop(project_id, None)
+        if old is not None:
+            self._index.remove_project(old)
+
+    def _put_item(self, item: Task):
+        self._items[item.id] = item
+        self._index.add_task(item.id, item.project_id, _due_day(item))
+
+    def _drop_item(self, item_id: str):
+        if item_id in self._items:
+            del self._items[item_id]
+        self._index.remove_task(item_id)
+
+    def _apply_delta(
+        self, raw_projects: list[dict[str, Any]], raw_items: list[dict[str, Any]]
+    ) -> set[str]:
+        """Merges a sync delta into the store, returning the ids of touched projects."""
+        touched: set[str] = set()
+        for raw in raw_projects:
+            project_id: str = raw["id"]
+            touched.add(project_id)
+            if is_project_tombstone(raw):
+                self._drop_project(project_id)
+                continue
+            self._put_project(Project.from_dict(raw))
+
+        for raw in raw_items:
+            item_id: str = raw["id"]
+            old_project_id = self._index.project_of(item_id)
+            if old_project_id is not None:
+                touched.add(old_project_id)
+            if is_item_tombstone(raw):
+                self._drop_item(item_id)
+                continue
+            item = Task.from_dict(raw)
+            touched.add(item.project_id)
+            self._put_item(item)
+        return touched
 
     def get_tasks(self, filter_obj: Filter | None = None) -> list[Task]:
         if not filter_obj:
-            return self._items
-
-        return [
-            task for task in self._items if self._task_matches_filter(task, filter_obj)
-        ]
-
-    def _task_matches_filter(self, task: Task, filter_obj: Filter) -> bool:
+            return list(self._items.values())
+
+        predicate, _ = self._compile(filter_obj)
+        if predicate is _never:
+            return []
+        candidates = self._candidates(filter_obj)
+        if candidates is None:
+            candidates = self._items.values()
+        return [task for task in candidates if predicate(task)]
+
+    def _tasks(self, task_ids: list[str]) -> list[Task]:
+        return [self._items[task_id] for task_id in task_ids]
+
+    def _candidates(self, filter_obj: Filter) -> list[Task] | None:
+        """
+        Narrows a filter down to a superset of its matches using the indexes.
+        None means the filter can't use an index and every task is a candidate.
+        """
         if isinstance(filter_obj, FilterProjectId):
-            return task.project_id == filter_obj.id
+            return self._tasks(self._index.task_ids_in_project(filter_obj.id))
 
         if isinstance(filter_obj, FilterProjectName):
-            project_map = {p.name: p.id for p in self._projects}
-            project_id = project_map.get(filter_obj.name)
-            return project_id is not None and task.project_id == project_id
-
-        if isinstance(filter_obj, FilterTaskNameMatches):
-            return filter_obj.substring.lower() in task.content.lower()
+            project_id = self._index.project_id(filter_obj.name)
+            if project_id is None:
+                return []
+            return self._tasks(self._index.task_ids_in_project(project_id))
 
         if isinstance(filter_obj, FilterTaskDue):
-            if not any([filter_obj.on, filter_obj.before, filter_obj.after]):
-                return False
-            if not task.due:
-                return False
-
-            task_due_obj = task.due.date 
-            def _compare(val1: ApiDue, val2, op) -> bool:
-                if type(val1) is not type(val2):
-                    v1 = val1.date() if isinstance(val1, datetime) else val1
-                    v2 = val2.date() if isinstance(val2, datetime) else val2
-                    return op(v1, v2)
-                return op(val1, val2)
-
-            if filter_obj.on:
-                if not _compare(task_due_obj, filter_obj.on, operator.eq):
-                    return False
-            if filter_obj.before:
-                if not _compare(task_due_obj, filter_obj.before, operator.lt):
-                    return False
-            if filter_obj.after:
-                if not _compare(task_due_obj, filter_obj.after, operator.gt):
-                    return False
-            return True
+            bounds = [filter_obj.on, filter_obj.before, filter_obj.after]
+            if not any(bounds):
+                return []
+            days = [b.date() if isinstance(b, datetime) else b for b in bounds]
+            on, before, after = days
+            # Inclusive day range; exact comparison is left to the compiled filter
+            return self._tasks(self._index.task_ids_due(on or after, on or before))
 
         if isinstance(filter_obj, FilterAND):
-            return all(
-                self._task_matches_filter(task, f) for f in filter_obj.filters
-            )
+            narrowed = [
+                c
+                for c in (self._candidates(f) for f in filter_obj.filters)
+                if c is not None
+            ]
+            return min(narrowed, key=len) if narrowed else None
+
+        if isinstance(filter_obj, FilterOR):
+            union: dict[str, Task] = {}
+            for f in filter_obj.filters:
+                candidates = self._candidates(f)
+                if candidates is None:
+                    return None
+                union.update((task.id, task) for task in candidates)
+            return list(union.values())
+
+        return None
+
+    def _compile(self, filter_obj: Filter) -> tuple[Callable[[Task], bool], int]:
+        """
+        Turns a filter tree into a single predicate, resolving project names and
+        date bounds once. Returns the predicate and its relative cost, which is
+        used to run cheaper checks first inside FilterAND/FilterOR.
+        """
+        if isinstance(filter_obj, FilterProjectId):
+            project_id = filter_obj.id
+            return (lambda task: task.project_id == project_id), 1
 
-        # FilterOR
-        return any(
-            self._task_matches_filter(task, f) for f in filter_obj.filters
-        )
+        if isinstance(filter_obj, FilterProjectName):
+            project_id = self._index.project_id(filter_obj.name)
+            if project_id is None:
+                return _never, 0
+            return (lambda task: task.project_id == project_id), 1
 
+        if isinstance(filter_obj, FilterTaskNameMatches):
+            substring = filter_obj.substring.lower()
+            return (lambda task: substring in task.content.lower()), 3
+
+        if isinstance(filter_obj, FilterTaskDue):
+            return _compile_due(filter_obj), 2
+
+        is_and = isinstance(filter_obj, FilterAND)
+        parts: list[tuple[Callable[[Task], bool], int]] = []
+        for f in _flatten(filter_obj):
+            predicate, cost = self._compile(f)
+            if is_and and predicate is _never:
+                return _never, 0
+            if not is_and and predicate is _never:
+                continue
+            parts.append((predicate, cost))
+        if not parts:
+            return (_always, 0) if is_and else (_never, 0)
+        parts.sort(key=lambda part: part[1])
+        if len(parts) == 1:
+            return parts[0]
+        predicates = tuple(predicate for predicate, _ in parts)
+        cost = sum(cost for _, cost in parts)
+        if is_and:
+            return (lambda task: all(p(task) for p in predicates)), cost
+        return (lambda task: any(p(task) for p in predicates)), cost
 
     def get_projects(self) -> list[Project]:
-        return self._projects
+        return list(self._projects.values())
 
     def get_project(self, id: str) -> Project:
-        p = next((p for p in self._projects if p.id == id), None)
+        p = self._projects.get(id)
         if not p:
             raise ValueError(f"Project with id {id} not found")
         return p
@@ -1,10 +1,15 @@
+import asyncio
 import os
+import re
 import sys
-from typing import final
+import threading
+from typing import AsyncIterator, Iterator, final
 from dotenv import load_dotenv
 from elevenlabs.client import ElevenLabs
 from loguru import logger
 
+from src.audio_cache import AudioCache, audio_key
+
 _ = load_dotenv()
 
 # Configure Loguru logger for standalone script usage
@@ -15,6 +20,15 @@ logger.add(
     level="DEBUG"
 )
 
+_SENTENCE_END = re.compile(r"(?<=[.!?…])\s+|\n+")
+
+
+def split_sentences(text: str) -> tuple[list[str], str]:
+    """Splits finished sentences off `text`, returning them and the unfinished tail."""
+    parts = _SENTENCE_END.split(text)
+    sentences = [part.strip() for part in parts[:-1] if part.strip()]
+    return sentences, parts[-1]
+
 
 @final
 class TTSManager:
@@ -24,23 +38,156 @@ class TTSManager:
             logger.error("ELEVENLABS_API_KEY environment variable not set.")
             raise ValueError("ELEVENLABS_API_KEY environment variable not set.")
         self.client = ElevenLabs(api_key=api_key)
+        self.model = "eleven_flash_v2_5"
+        self.output_format = "mp3_22050_32"
+        self.voice = os.environ.get("ELEVENLABS_VOICE_ID")
+        # Sentences synthesized ahead of the one currently being sent
+        self.max_sentences_ahead = 3
+        cache_home = os.getenv("XDG_CACHE_HOME", os.path.expanduser("~/.cache"))
+        self.cache = AudioCache(os.path.join(cache_home, "todo_server", "tts"))
+
+    def _cache_key(self, text: str) -> str:
+        return audio_key(text, self.model, self.voice or "default", self.output_format)
 
-    def text_to_speech(self, text: str):
+    def _generate(self, text: str, stream: bool = False):
+        voice = {"voice": self.voice} if self.voice else {}
+        return self.client.generate(
+            text=text,
+            # optimize_streaming_latency=1,
+            model=self.model,
+            output_format=self.output_format,
+            stream=stream,
+            **voice,
+        )
+
+    def _chunks(
+        self, text: str, stop: threading.Event | None, stream: bool = False
+    ) -> Iterator[bytes]:
+        """Audio of `text`; stops reading the response once `stop` is set."""
+        chunks = self._generate(text, stream=stream)
+        try:
+            for chunk in chunks:
+                if stop is not None and stop.is_set():
+                    return
+                yield chunk
+        finally:
+            # Closes the HTTP response, so ElevenLabs stops generating
+            close = getattr(chunks, "close", None)
+            if close is not None:
+                close()
+
+    def text_to_speech(self, text: str, stop: threading.Event | None = None):
+        """
+        Blocking. Setting `stop` from another thread abandons the synthesis,
+        e.g. once the client has gone away.
+        """
+        key = self._cache_key(text)
+        cached = self.cache.get(key)
+        if cached is not None:
+            logger.info(f"Using cached speech for text: '{text[:50]}...'")
+            return cached
         logger.info(f"Generating speech for text: '{text[:50]}...'")
         try:
-            result = self.client.generate(
-                text=text,
-                # optimize_streaming_latency=1,
-                model="eleven_flash_v2_5",
-                output_format="mp3_22050_32",
-            )
-            audio_bytes = b"".join(result)
+            audio_bytes = b"".join(self._chunks(text, stop))
+            if stop is not None and stop.is_set():
+                logger.info("Speech generation stopped")
+                return ""
             logger.info(f"Generated {len(audio_bytes)} bytes of audio.")
+            self.cache.put(key, audio_bytes)
             return audio_bytes
         except Exception as e:
             logger.error(f"Failed to generate audio: {e}")
             return ""
 
+    async def _synthesize_into(
+        self,
+        text: str,
+        queue: asyncio.Queue[bytes | None],
+        slots: asyncio.Semaphore,
+        stop: threading.Event,
+    ):
+        key = self._cache_key(text)
+        # A disk hit reads a file, keep it off the event loop
+        cached = await asyncio.to_thread(self.cache.get, key)
+        if cached is not None:
+            logger.debug(f"Using cached speech for sentence: '{text[:50]}'")
+            queue.put_nowait(cached)
+            queue.put_nowait(None)
+            return
+        loop = asyncio.get_running_loop()
+
+        def produce():
+            chunks: list[bytes] = []
+            try:
+                for chunk in self._chunks(text, stop, stream=True):
+                    chunks.append(chunk)
+                    _ = loop.call_soon_threadsafe(queue.put_nowait, chunk)
+                if not stop.is_set():
+                    self.cache.put(key, b"".join(chunks))
+            finally:
+                _ = loop.call_soon_threadsafe(queue.put_nowait, None)
+
+        async with slots:
+            if stop.is_set():
+                return
+            try:
+                await asyncio.to_thread(produce)
+            except Exception as e:
+                logger.error(f"Failed to generate audio for '{text[:50]}': {e}")
+
+    async def stream_speech(
+        self, text_deltas: AsyncIterator[str]
+    ) -> AsyncIterator[bytes]:
+        """
+        Yields audio chunks for text that is still being generated.
+
+        Each finished sentence is synthesized as soon as it appears in
+        `text_deltas`, while audio of earlier sentences is being yielded.
+        Chunks are yielded in sentence order.
+        """
+        sentence_queues: asyncio.Queue[asyncio.Queue[bytes | None] | None] = (
+            asyncio.Queue()
+        )
+        synthesis_tasks: list[asyncio.Task[None]] = []
+        slots = asyncio.Semaphore(self.max_sentences_ahead)
+        # Cancelling a task does not stop its thread, this does
+        stop = threading.Event()
+
+        def start(sentence: str):
+            logger.debug(f"Synthesizing sentence: '{sentence[:50]}'")
+            queue: asyncio.Queue[bytes | None] = asyncio.Queue()
+            synthesis_tasks.append(
+                asyncio.create_task(
+                    self._synthesize_into(sentence, queue, slots, stop)
+                )
+            )
+            sentence_queues.put_nowait(queue)
+
+        async def split():
+            buffer = ""
+            try:
+                async for delta in text_deltas:
+                    buffer += delta
+                    sentences, buffer = split_sentences(buffer)
+                    for sentence in sentences:
+                        start(sentence)
+                if buffer.strip():
+                    start(buffer.strip())
+            finally:
+                sentence_queues.put_nowait(None)
+
+        splitter = asyncio.create_task(split())
+        try:
+            while (queue := await sentence_queues.get()) is not None:
+                while (chunk := await queue.get()) is not None:
+                    yield chunk
+            await splitter
+        finally:
+            stop.set()
+            _ = splitter.cancel()
+            for task in synthesis_tasks:
+                _ = task.cancel()
+
 
 if __name__ == "__main__":
     logger.info("Running TTSManager standalone test.")
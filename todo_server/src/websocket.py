@@ -7,19 +7,20 @@ import asyncio  # Add this import
 import json
 import os
 import sys
+import threading
+from collections import Counter
+from dataclasses import dataclass, field
 from typing import final
 from fastapi import WebSocket, WebSocketDisconnect, status
 from enum import StrEnum
 from dotenv import load_dotenv
 from loguru import logger
-from openai.types.chat import ChatCompletionMessageParam
 
-from src.ai_manager import AiManager
-from src.code_manager import CodeManager
-from src.groq_manager import GroqManager
-from src.task_client import TaskClient
-from src.todoist_manager import TodoistManager, TodoistManagerSyncEndpoint
-from src.tts_manager import TTSManager
+from src.answer_templates import template_answer
+from src.audio_buffer import AudioTooLargeError, IngestBuffer
+from src.audio_segmenter import AudioSegmenter, pcm_to_wav
+from src.history_manager import HistoryManager
+from src.services import Services
 
 _ = load_dotenv()
 
@@ -28,6 +29,10 @@ if not TODOIST_AGENT_ACCESS_KEY:
     logger.error("TODOIST_AGENT_ACCESS_KEY environment variable not set.")
     raise ValueError("TODOIST_AGENT_ACCESS_KEY environment variable not set.")
 
+# Telephone-band to studio rates; others are more likely a client bug
+MIN_SAMPLE_RATE = 8000
+MAX_SAMPLE_RATE = 48000
+
 
 logger.remove()
 _ = logger.add(
@@ -42,32 +47,133 @@ class MessageType(StrEnum):
     INFO = "info"
     TRANSCRIPTION = "transcription"
     CODE = "code"
+    CODE_DELTA = "code_delta"
     ANSWER = "answer"
+    ANSWER_DELTA = "answer_delta"
     AI_SPEECH = "ai_speech"
+    AI_SPEECH_END = "ai_speech_end"
+
+
+class SessionPhase(StrEnum):
+    IDLE = "idle"
+    LISTENING = "listening"
+    PROCESSING = "processing"
+
+
+@dataclass
+class SessionState:
+    """Mutable state of a single websocket session."""
+
+    segmenter: AudioSegmenter | None = None
+    transcription: str | None = None
+    # Sync started when the user begins talking, awaited before code generation
+    todoist_refresh: asyncio.Task[None] | None = None
+    audio_buffer: IngestBuffer = field(default_factory=IngestBuffer)
+    received_bytes: int = 0
+    # Set once an utterance went over the size limit, until its END_AUDIO
+    audio_rejected: bool = False
+    segment_tasks: list[asyncio.Task[str]] = field(default_factory=list)
+    history: HistoryManager = field(default_factory=HistoryManager)
 
 
 @final
 class WebsocketManager:
-    def __init__(self, ws: WebSocket, is_muted: bool = False):
+    def __init__(
+        self,
+        ws: WebSocket,
+        services: Services,
+        is_muted: bool = False,
+        is_streaming: bool = False,
+        is_streaming_audio: bool = False,
+        pcm_sample_rate: int | None = None,
+    ):
         self.is_muted = is_muted
-        self.groq_manager = GroqManager()
-        self.todoist_manager = TodoistManager()
-        self.todoist_manager_se = TodoistManagerSyncEndpoint()
-        self.ai_manager = AiManager()
-        self.code_manager = CodeManager()
-        self.tts_manager = TTSManager()
-
-        self.task_client = TaskClient(self.todoist_manager_se)
+        self.is_streaming = is_streaming
+        self.is_streaming_audio = is_streaming_audio
+        # Raw PCM uploads are transcribed segment by segment while they arrive
+        self.pcm_sample_rate = pcm_sample_rate
+        self.groq_manager = services.groq_manager
+        self.todoist_manager_se = services.todoist_manager_se
+        self.ai_manager = services.ai_manager
+        self.code_manager = services.code_manager
+        self.code_cache = services.code_cache
+        self.tts_manager = services.tts_manager
+
+        self.task_client = services.task_client
         self.ws = ws
+        self.max_audio_bytes = 25 * 1024 * 1024
 
+        self.phase = SessionPhase.IDLE
+        # Runs exec_flow, so the receive loop keeps reading frames meanwhile
+        self.flow_task: asyncio.Task[None] | None = None
+        self.state = SessionState()
         self.reset()
 
     def reset(self):
         logger.info("Resetting WebsocketManager")
-        self.transcription = None
-        self.todoist_coro = None
-        self.audio_buffer = bytearray()
-        self.history: list[ChatCompletionMessageParam] = []
+        self.phase = SessionPhase.IDLE
+        self.cancel_segments()
+        self.state.audio_buffer.close()
+        self.state = SessionState(
+            segmenter=self.new_segmenter(), audio_buffer=self.new_audio_buffer()
+        )
+
+    def new_audio_buffer(self) -> IngestBuffer:
+        return IngestBuffer(self.max_audio_bytes)
+
+    def new_segmenter(self) -> AudioSegmenter | None:
+        if self.pcm_sample_rate is None:
+            return None
+        return AudioSegmenter(self.pcm_sample_rate)
+
+    def cancel_segments(self):
+        for task in self.state.segment_tasks:
+            _ = task.cancel()
+
+    def reset_segments(self):
+        self.cancel_segments()
+        self.state.segment_tasks = []
+        self.state.segmenter = self.new_segmenter()
+
+    def set_phase(self, phase: SessionPhase):
+        if phase != self.phase:
+            logger.debug(f"Session phase: {self.phase} -> {phase}")
+            self.phase = phase
+
+    def start_flow(self, transcription: str | None = None):
+        self.set_phase(SessionPhase.PROCESSING)
+        self.flow_task = asyncio.create_task(self.run_flow(transcription))
+
+    async def run_flow(self, transcription: str | None):
+        try:
+            await self.exec_flow(transcription)
+        except asyncio.CancelledError:
+            logger.info("Request processing cancelled")
+            raise
+        except WebSocketDisconnect:
+            logger.info("Client disconnected during request processing")
+        except Exception as e:
+            error_message = f"Request processing failed: {e}"
+            logger.exception(error_message)
+            await self.send_message(MessageType.ERROR, error_message)
+        finally:
+            if self.phase == SessionPhase.PROCESSING:
+                self.set_phase(SessionPhase.IDLE)
+
+    async def cancel_flow(self):
+        """Stops in-flight transcription, LLM, code and TTS work of the session."""
+        task, self.flow_task = self.flow_task, None
+        if task is None or task.done():
+            return
+        logger.info("Cancelling in-flight request")
+        _ = task.cancel()
+        # Let its cleanup run before new audio reaches the session state
+        _ = await asyncio.wait([task])
+
+    async def close(self):
+        await self.cancel_flow()
+        self.cancel_segments()
+        self.state.audio_buffer.close()
 
     async def send_message(self, message_type: MessageType, message: str):
         # Use debug for potentially verbose messages, info for confirmation
@@ -91,98 +197,274 @@ class WebsocketManager:
         await self.ws.send_bytes(message)
         logger.info(f"Sent {message_type} message: {len(message)} bytes (awaited).")
 
+    def delta_sender(self, message_type: MessageType):
+        if not self.is_streaming:
+            return None
+
+        async def send_delta(delta: str):
+            await self.ws.send_text(json.dumps({"type": message_type, "message": delta}))
+
+        return send_delta
+
     def fetch_todoist_context(self):
-        self.todoist_coro = self.todoist_manager_se.get_context()
+        refresh = self.state.todoist_refresh
+        if refresh is not None and not refresh.done():
+            # Left over from a cancelled request and still useful
+            return
+        # refresh() does not raise, so an abandoned prefetch (e.g. after INIT
+        # replaced the session state) leaves no unretrieved exception
+        self.state.todoist_refresh = asyncio.create_task(
+            self.todoist_manager_se.refresh()
+        )
         logger.info("Fetching tasks initiated.")
 
-    def add_chunk(self, chunk: bytes):
-        self.audio_buffer.extend(chunk)
+    async def add_chunk(self, chunk: bytes):
+        if self.phase == SessionPhase.PROCESSING:
+            logger.warning("Dropping audio chunk received without START_AUDIO")
+            return
+        if self.state.audio_rejected:
+            return
+        self.state.received_bytes += len(chunk)
+        if self.state.segmenter is not None:
+            if self.state.received_bytes > self.max_audio_bytes:
+                await self.reject_audio()
+                return
+            for segment in self.state.segmenter.feed(chunk):
+                self.transcribe_segment(segment)
+            logger.debug(
+                f"Received audio chunk: {len(chunk)} bytes. Pending: {len(self.state.segmenter)} bytes."
+            )
+            return
+        try:
+            self.state.audio_buffer.write(chunk)
+        except AudioTooLargeError:
+            await self.reject_audio()
+            return
         logger.debug(
-            f"Received audio chunk: {len(chunk)} bytes. Total: {len(self.audio_buffer)} bytes."
+            f"Received audio chunk: {len(chunk)} bytes. Total: {len(self.state.audio_buffer)} bytes."
+        )
+
+    async def reject_audio(self):
+        self.state.audio_rejected = True
+        self.reset_audio()
+        error_message = (
+            f"Audio stream exceeds the limit of {self.max_audio_bytes // (1024 * 1024)} MB"
+            " and was discarded."
+        )
+        logger.warning(error_message)
+        await self.send_message(MessageType.ERROR, error_message)
+
+    def reset_audio(self):
+        self.state.audio_buffer.close()
+        self.state.audio_buffer = self.new_audio_buffer()
+        self.reset_segments()
+
+    def transcribe_segment(self, pcm: bytes):
+        assert self.state.segmenter is not None
+        n_segment = len(self.state.segment_tasks)
+        logger.info(f"Transcribing segment {n_segment}: {len(pcm)} bytes")
+        wav = pcm_to_wav(pcm, self.state.segmenter.sample_rate)
+        self.state.segment_tasks.append(
+            asyncio.create_task(
+                self.groq_manager.transcribe_audio(wav, file_format="wav")
+            )
         )
 
+    async def transcribe_segments(self) -> str:
+        assert self.state.segmenter is not None
+        rest = self.state.segmenter.flush()
+        if rest:
+            self.transcribe_segment(rest)
+        texts = await asyncio.gather(*self.state.segment_tasks)
+        return " ".join(text.strip() for text in texts if text.strip())
+
     async def transcribe(self):
+        # A failed or rejected utterance must not re-run the previous request
+        self.state.transcription = None
         try:
-            self.transcription = await self.groq_manager.transcribe_audio(
-                bytes(self.audio_buffer), file_format="opus"
-            )
-            await self.send_message(MessageType.TRANSCRIPTION, self.transcription)
+            if self.state.audio_rejected:
+                return
+            if self.state.segmenter is not None:
+                self.state.transcription = await self.transcribe_segments()
+            else:
+                # The buffer is uploaded as a file object, without copying it
+                self.state.transcription = await self.groq_manager.transcribe_audio(
+                    self.state.audio_buffer.file(), file_format="opus"
+                )
+            await self.send_message(MessageType.TRANSCRIPTION, self.state.transcription)
         except Exception as e:
             error_message = f"Transcription task failed: {e}"
             logger.error(error_message)
             await self.send_message(MessageType.ERROR, error_message)
         finally:
-            self.audio_buffer = bytearray()
+            self.reset_audio()
+            self.state.received_bytes = 0
+            self.state.audio_rejected = False
 
     async def todoist_context(self):
         logger.info("Fetching todoist context...")
-        if self.todoist_coro is None:
-            logger.warning(
-                "todoist_coro was None when tasks() was called. Re-fetching."
-            )
-            self.todoist_coro = self.todoist_manager.get_tasks()
-        context = await self.todoist_coro
+        refresh, self.state.todoist_refresh = self.state.todoist_refresh, None
+        if refresh is None:
+            refresh = asyncio.create_task(self.todoist_manager_se.refresh())
+        await refresh
+        if self.state.transcription is None:
+            context = await self.todoist_manager_se.get_context()
+        else:
+            # Fit the overview into the prompt budget, favouring relevant tasks
+            context = self.todoist_manager_se.select_context(self.state.transcription)
         logger.info("Todoist context ready")
         return context
 
     async def exec_flow(self, transcription: str | None = None):
         if transcription is None:
-            n_bytes = len(self.audio_buffer)
+            n_bytes = self.state.received_bytes
             logger.info(
                 f"Finished receiving audio: {n_bytes} bytes. Starting transcription."
             )
             await self.transcribe()
         else:
             logger.info(f"Using provided transcription: {transcription}")
-            self.transcription = transcription
-        if self.transcription is None:
+            self.state.transcription = transcription
+        if self.state.transcription is None:
             return
         context = await self.todoist_context()
         code_info = self.task_client.get_code_info()
-        code = self.ai_manager.get_code_ai_response(
-            context, code_info, self.transcription, self.history
-        )
+        code = self.code_cache.lookup(self.state.transcription, code_info)
+        is_cached = code is not None
+        if code is None:
+            code = await self.ai_manager.get_code_ai_response(
+                context,
+                code_info,
+                self.state.transcription,
+                self.state.history.messages(),
+                on_delta=self.delta_sender(MessageType.CODE_DELTA),
+            )
+        else:
+            logger.info("Using cached code for the request")
         await self.send_message(MessageType.CODE, code)
         await asyncio.sleep(0.0)
 
         logger.debug("Executing code...")
-        exec_result = self.code_manager.execute(self.task_client, code)
+        writes: Counter[str] = Counter()
+        exec_result = await self.code_manager.run(self.task_client, code, writes)
         logger.debug("Code execution finished.")
+        succeeded = exec_result.startswith("Successfully executed code")
+        # Code written with history in the prompt may refer to earlier turns
+        if succeeded and not is_cached and len(self.state.history) == 0:
+            try:
+                _ = self.code_cache.store(self.state.transcription, code, code_info)
+            except Exception as e:
+                # Caching is best effort, the request itself has succeeded
+                logger.warning(f"Failed to cache generated code: {e}")
+        elif not succeeded and is_cached:
+            self.code_cache.evict(self.state.transcription)
         await self.send_message(MessageType.INFO, exec_result)
         await asyncio.sleep(0.0)
 
-        answer = self.ai_manager.get_answer_ai_response(
-            context, code, exec_result, self.history
+        answer = template_answer(code, exec_result, writes)
+        if answer is not None:
+            logger.info("Answering from a template, skipping the answer model call")
+            await self.send_message(MessageType.ANSWER, answer)
+            await self.speak(answer)
+            self.update_history(code, exec_result, answer)
+            return
+
+        if not self.is_muted and self.is_streaming_audio:
+            answer = await self.answer_with_streaming_speech(context, code, exec_result)
+            self.update_history(code, exec_result, answer)
+            return
+
+        answer = await self.ai_manager.get_answer_ai_response(
+            context,
+            code,
+            exec_result,
+            self.state.history.messages(),
+            on_delta=self.delta_sender(MessageType.ANSWER_DELTA),
         )
         await self.send_message(MessageType.ANSWER, answer)
         await asyncio.sleep(0.0)
 
-        if not self.is_muted:
-            audio = self.tts_manager.text_to_speech(answer)
+        await self.speak(answer)
+        self.update_history(code, exec_result, answer)
+
+    async def answer_with_streaming_speech(
+        self, context: str, code: str, exec_result: str
+    ) -> str:
+        """Speaks the answer sentence by sentence while it is still being generated."""
+        text_queue: asyncio.Queue[str | None] = asyncio.Queue()
+        send_answer_delta = self.delta_sender(MessageType.ANSWER_DELTA)
+
+        async def on_delta(delta: str):
+            text_queue.put_nowait(delta)
+            if send_answer_delta is not None:
+                await send_answer_delta(delta)
+
+        async def text_deltas():
+            while (delta := await text_queue.get()) is not None:
+                yield delta
+
+        async def send_speech():
+            async for chunk in self.tts_manager.stream_speech(text_deltas()):
+                await self.ws.send_bytes(chunk)
+            await self.send_message(MessageType.AI_SPEECH_END, "")
+
+        speech = asyncio.create_task(send_speech())
+        try:
+            answer = await self.ai_manager.get_answer_ai_response(
+                context,
+                code,
+                exec_result,
+                self.state.history.messages(),
+                on_delta=on_delta,
+            )
+        except BaseException:
+            _ = speech.cancel()
+            raise
+        finally:
+            text_queue.put_nowait(None)
+        await self.send_message(MessageType.ANSWER, answer)
+        await speech
+        return answer
+
+    async def speak(self, answer: str):
+        if self.is_muted:
+            logger.info("Muted mode enabled. Not sending AI speech.")
+            return
+        if not self.is_streaming_audio:
+            # Blocking HTTP and cache I/O; the loop must keep serving frames
+            stop = threading.Event()
+            try:
+                audio = await asyncio.to_thread(
+                    self.tts_manager.text_to_speech, answer, stop
+                )
+            finally:
+                # After a barge-in or a disconnect the thread would go on
+                stop.set()
             if audio:
                 await self.send_bytes(MessageType.AI_SPEECH, audio)
-        else:
-            logger.info("Muted mode enabled. Not sending AI speech.")
+            return
 
-        self.update_history(code, exec_result, answer)
+        async def text_deltas():
+            yield answer
+
+        async for chunk in self.tts_manager.stream_speech(text_deltas()):
+            await self.ws.send_bytes(chunk)
+        await self.send_message(MessageType.AI_SPEECH_END, "")
 
     def update_history(self, code: str, exec_result: str, answer: str):
-        transcription = """
-<user_request_history>
-{transcription}
-</user_request_history>
-        """.strip()
-        self.history.append({"content": transcription, "role": "user"})
-        combined_message = f"""<code_history>
-{code}
-</code_history>
-<output_history>
-{exec_result}
-</output_history>
-<answer_history>
-{answer}
-</answer_history>""".strip()
-        self.history.append({"content": combined_message, "role": "assistant"})
+        transcription = self.state.transcription or ""
+        self.state.history.add(transcription, code, exec_result, answer)
+
+
+def parse_sample_rate(value: str) -> int | None:
+    """None unless `value` is a whole number of Hz that segmenting can use."""
+    try:
+        sample_rate = int(value)
+    except ValueError:
+        return None
+    if not MIN_SAMPLE_RATE <= sample_rate <= MAX_SAMPLE_RATE:
+        return None
+    return sample_rate
 
 
 async def websocket_endpoint(websocket: WebSocket):
@@ -195,31 +477,67 @@ async def websocket_endpoint(websocket: WebSocket):
         return
 
     is_muted = websocket.headers.get("X-Muted", "false").lower() == "true"
+    # Delta messages are opt-in so clients that render every message keep working
+    is_streaming = websocket.headers.get("X-Stream", "false").lower() == "true"
+    is_streaming_audio = (
+        websocket.headers.get("X-Stream-Audio", "false").lower() == "true"
+    )
+    # "pcm16" means raw 16-bit mono PCM, which can be cut and transcribed in segments
+    pcm_sample_rate = None
+    if websocket.headers.get("X-Audio-Format", "opus").lower() == "pcm16":
+        pcm_sample_rate = parse_sample_rate(
+            websocket.headers.get("X-Audio-Sample-Rate", "16000")
+        )
+        if pcm_sample_rate is None:
+            logger.warning(
+                f"WebSocket connection rejected for {websocket.client}: Invalid X-Audio-Sample-Rate header."
+            )
+            await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+            return
 
     await websocket.accept()
     logger.info(f"Client {websocket.client} connected with valid access key.")
-    manager = WebsocketManager(websocket, is_muted)
+    services: Services = websocket.app.state.services
+    manager = WebsocketManager(
+        websocket,
+        services,
+        is_muted,
+        is_streaming,
+        is_streaming_audio,
+        pcm_sample_rate,
+    )
     try:
         while True:
             message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                # receive() reports a disconnect as a message, not an exception
+                logger.info(f"Client {websocket.client} disconnected")
+                await manager.cancel_flow()
+                break
             if message.get("text", False):
                 data: str = message["text"]
                 logger.info(f"Received message: {data}")
                 if data == "INIT":
+                    await manager.cancel_flow()
                     manager.reset()
                 elif data == "START_AUDIO":
+                    # Barge-in: the user started talking over the previous answer
+                    await manager.cancel_flow()
+                    manager.set_phase(SessionPhase.LISTENING)
                     manager.fetch_todoist_context()
                     await manager.send_message(
                         MessageType.INFO, "Audio transmission started."
                     )
                 elif data == "END_AUDIO":
-                    await manager.exec_flow()
+                    await manager.cancel_flow()
+                    manager.start_flow()
                 else:
                     try:
                         json_data: dict[str, str] = json.loads(data)
                         if json_data.get("type") == MessageType.TRANSCRIPTION:
+                            await manager.cancel_flow()
                             manager.fetch_todoist_context()
-                            await manager.exec_flow(json_data["message"])
+                            manager.start_flow(json_data["message"])
                     except json.JSONDecodeError:
                         logger.warning(f"Received invalid JSON data: {data}")
                         await manager.send_message(
@@ -229,7 +547,9 @@ async def websocket_endpoint(websocket: WebSocket):
 
             elif message.get("bytes", False):
                 audio_chunk: bytes = message["bytes"]
-                manager.add_chunk(audio_chunk)
+                await manager.add_chunk(audio_chunk)
 
     except WebSocketDisconnect:
         logger.info(f"Client {websocket.client} disconnected")
+    finally:
+        await manager.close()
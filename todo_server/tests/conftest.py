@@ -0,0 +1,15 @@
+import pytest
+
+from src.todoist_manager import TodoistManagerSyncEndpoint
+
+
+@pytest.fixture
+def todoist_env(monkeypatch, tmp_path):
+    """A fake Todoist key and a private data directory for the sync store."""
+    monkeypatch.setenv("TODOIST_API_KEY", "test")
+    monkeypatch.setenv("XDG_DATA_HOME", str(tmp_path))
+
+
+@pytest.fixture
+def sync_store(todoist_env) -> TodoistManagerSyncEndpoint:
+    return TodoistManagerSyncEndpoint()
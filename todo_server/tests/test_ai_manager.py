@@ -1,6 +1,7 @@
-from src.ai_manager import AiManager
+from src.ai_manager import AiManager, _Prompt
 from src.todoist_manager import TodoistManager
 import asyncio
+import pytest
 
 
 def test_ai_manager_prompt():
@@ -19,7 +20,9 @@ def test_ai_manager_response():
     tasks = asyncio.run(todoist_manager.get_tasks())
     code_info = todoist_manager.get_code_info()
     user_request = "Добавь задачу на завтра - почитать книгу"
-    response = ai_manager.get_code_ai_response(tasks, code_info, user_request)
+    response = asyncio.run(
+        ai_manager.get_code_ai_response(tasks, code_info, user_request)
+    )
     print(response)
 
 
@@ -41,5 +44,83 @@ if project_id is None:
     result = """
 Successfully executed code:
     """.strip()
-    summary = ai_manager.get_answer_ai_response(request, code, result)
+    summary = asyncio.run(ai_manager.get_answer_ai_response(request, code, result))
     print(summary)
+
+
+def test_ai_manager_hedged_fallback(monkeypatch):
+    monkeypatch.setenv("OPENROUTER_API_KEY", "test")
+    ai_manager = AiManager(hedging=True)
+    ai_manager.hedge_delay = 0.01
+    started: list[str] = []
+
+    async def fake_request(model, messages, stream=None):
+        started.append(model)
+        if model == ai_manager.model:
+            await asyncio.sleep(10)
+        return f"answer from {model}"
+
+    monkeypatch.setattr(ai_manager, "_request", fake_request)
+    result = asyncio.run(ai_manager._call_ai("system", "request", kind="code"))
+    assert result == f"answer from {ai_manager.fallbacks[0]}"
+    assert started[:2] == [ai_manager.model, ai_manager.fallbacks[0]]
+    # The cancelled slow model still counts, at least as long as it ran
+    (censored,) = ai_manager._latencies[(ai_manager.model, "code")]
+    assert censored >= ai_manager.hedge_delay
+    assert (ai_manager.fallbacks[0], "code") in ai_manager._latencies
+    assert (ai_manager.model, "answer") not in ai_manager._latencies
+
+
+def test_ai_manager_no_fallback_after_partial_stream(monkeypatch):
+    monkeypatch.setenv("OPENROUTER_API_KEY", "test")
+    ai_manager = AiManager(hedging=False)
+    deltas: list[str] = []
+
+    async def on_delta(delta: str):
+        deltas.append(delta)
+
+    async def fake_complete(model, prompt, stream=None):
+        await stream.forward(model, f"partial from {model}")
+        if model == ai_manager.model:
+            stream.release(model)
+            raise RuntimeError("connection reset")
+        return f"answer from {model}"
+
+    monkeypatch.setattr(ai_manager, "_complete", fake_complete)
+    with pytest.raises(Exception, match="partial output"):
+        asyncio.run(ai_manager._call_ai("system", "request", on_delta=on_delta))
+    assert deltas == [f"partial from {ai_manager.model}"]
+
+
+def test_prompt_layout_keeps_a_stable_prefix(monkeypatch):
+    monkeypatch.setenv("OPENROUTER_API_KEY", "test")
+    ai_manager = AiManager()
+    history = [{"role": "user", "content": "earlier"}]
+    prompt = _Prompt("system", "tasks", history, "request")
+
+    system, *rest = prompt.messages(cache_hints=True)
+    assert [block["text"] for block in system["content"]] == ["system", "tasks"]
+    assert all(
+        block["cache_control"] == {"type": "ephemeral"} for block in system["content"]
+    )
+    assert rest == [*history, {"role": "user", "content": "request"}]
+    assert prompt.messages(cache_hints=False)[0] == {
+        "role": "system",
+        "content": "system\n\ntasks",
+    }
+
+    calls: list[dict] = []
+
+    async def fake_call_ai(system_prompt, user_request, **kwargs):
+        calls.append({"system": system_prompt, "user": user_request, **kwargs})
+        return "print(1)"
+
+    monkeypatch.setattr(ai_manager, "_call_ai", fake_call_ai)
+    for request in ("first", "second"):
+        _ = asyncio.run(ai_manager.get_code_ai_response("tasks", "spec", request))
+    # Only the request and the date vary; they go after the cached blocks
+    assert calls[0]["system"] == calls[1]["system"]
+    assert calls[0]["context"] == calls[1]["context"]
+    assert "Today is" not in calls[0]["system"]
+    assert "Today is" in calls[0]["user"]
+    assert calls[0]["kind"] == "code"
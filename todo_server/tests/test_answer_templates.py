@@ -0,0 +1,83 @@
+from collections import Counter
+
+from src.answer_templates import template_answer
+
+COUNT_CODE = "print(len(client.get_tasks(FilterTaskDue(today, today))))"
+NO_WRITES: Counter[str] = Counter()
+
+
+def test_count_and_list_answers():
+    assert (
+        template_answer(COUNT_CODE, "Successfully executed code:\n 2", NO_WRITES)
+        == "2 задачи."
+    )
+    assert (
+        template_answer(COUNT_CODE, "Successfully executed code:\n 0", NO_WRITES)
+        == "Задач не найдено."
+    )
+    list_code = "for t in client.get_tasks():\n    print(t.content)"
+    assert template_answer(
+        list_code,
+        "Successfully executed code:\n Купить хлеб\nПозвонить маме.",
+        NO_WRITES,
+    ) == ("2 задачи: Купить хлеб; Позвонить маме.")
+
+
+def test_confirmations_follow_accepted_writes():
+    add_code = 'client.add_task("Купить хлеб", project_id=pid)'
+    assert (
+        template_answer(add_code, "Successfully executed code:", Counter(item_add=1))
+        == "Задача добавлена."
+    )
+    loop_code = "for t in client.get_tasks():\n    client.complete_task(t.id)"
+    assert (
+        template_answer(loop_code, "Successfully executed code:", Counter(item_close=3))
+        == "Задачи отмечены выполненными."
+    )
+    # The loop ran over an empty result and nothing was completed
+    assert template_answer(loop_code, "Successfully executed code:", NO_WRITES) is None
+
+
+def test_errors_and_unrecognized_output():
+    assert template_answer(
+        COUNT_CODE, "Error executing code: timed out after 20.0s", NO_WRITES
+    ) == ("Запрос выполнялся слишком долго и был остановлен.")
+    assert (
+        template_answer(COUNT_CODE, "Error executing code: KeyError 'x'", NO_WRITES)
+        is None
+    )
+    assert (
+        template_answer(
+            COUNT_CODE,
+            "Successfully executed code:\n Task(id='6Xq3v8Jc9m')",
+            NO_WRITES,
+        )
+        is None
+    )
+    code = "print(client.get_tasks())\nprint(client.get_all_projects())"
+    assert template_answer(code, "Successfully executed code:\n 2", NO_WRITES) is None
+
+
+def test_only_counts_and_names_are_templated():
+    sentence_code = (
+        "tasks = client.get_tasks(FilterTaskDue(today, today))\n"
+        'print(f"У вас {len(tasks)} задач на сегодня")'
+    )
+    assert (
+        template_answer(
+            sentence_code,
+            "Successfully executed code:\n У вас 2 задач на сегодня",
+            NO_WRITES,
+        )
+        is None
+    )
+    flag_code = "t = client.get_tasks(FilterTaskNameMatches('хлеб'))\nprint(bool(t))"
+    assert (
+        template_answer(flag_code, "Successfully executed code:\n False", NO_WRITES)
+        is None
+    )
+    priority_code = "for t in client.get_tasks():\n    print(t.priority)"
+    assert (
+        template_answer(priority_code, "Successfully executed code:\n 4", NO_WRITES)
+        is None
+    )
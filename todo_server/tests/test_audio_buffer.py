@@ -0,0 +1,17 @@
+import pytest
+
+from src.audio_buffer import AudioTooLargeError, IngestBuffer
+
+
+def test_buffer_spills_to_disk_and_enforces_limit():
+    buffer = IngestBuffer(max_bytes=100, spill_bytes=10)
+    buffer.write(b"a" * 8)
+    assert not buffer.spilled
+    buffer.write(b"b" * 8)
+    assert buffer.spilled
+    assert buffer.file().read() == b"a" * 8 + b"b" * 8
+
+    with pytest.raises(AudioTooLargeError):
+        buffer.write(b"c" * 85)
+    assert len(buffer) == 16
+    buffer.close()
@@ -0,0 +1,25 @@
+import os
+
+from src.audio_cache import AudioCache, audio_key
+
+
+def test_audio_is_served_from_memory_then_disk(tmp_path):
+    key = audio_key("Готово.", "model", "voice", "mp3")
+    assert key != audio_key("Готово.", "model", "other voice", "mp3")
+
+    cache = AudioCache(str(tmp_path))
+    assert cache.get(key) is None
+    cache.put(key, b"mp3 bytes")
+    assert cache.get(key) == b"mp3 bytes"
+
+    reopened = AudioCache(str(tmp_path))
+    assert reopened.get(key) == b"mp3 bytes"
+
+
+def test_disk_tier_evicts_least_recently_used(tmp_path):
+    cache = AudioCache(str(tmp_path), max_memory_bytes=0, max_disk_bytes=250)
+    for i, key in enumerate(["a", "b", "c"]):
+        cache.put(key, bytes(100))
+        os.utime(tmp_path / f"{key}.audio", (i, i))
+    assert cache.get("a") is None
+    assert cache.get("c") == bytes(100)
@@ -0,0 +1,24 @@
+from array import array
+
+from src.audio_segmenter import AudioSegmenter
+
+
+def _pcm(seconds: float, amplitude: int, sample_rate: int = 16000) -> bytes:
+    n_samples = int(seconds * sample_rate)
+    return array("h", [amplitude if i % 2 else -amplitude for i in range(n_samples)]).tobytes()
+
+
+def test_segment_is_cut_at_pause():
+    segmenter = AudioSegmenter(min_seconds=1.0, silence_seconds=0.2)
+    assert segmenter.feed(_pcm(1.0, 3000)) == []
+    segments = segmenter.feed(_pcm(0.3, 0))
+    assert len(segments) == 1
+    assert len(segments[0]) == len(_pcm(1.3, 0))
+    assert segmenter.flush() == b""
+
+
+def test_long_speech_is_cut_at_max_size():
+    segmenter = AudioSegmenter(min_seconds=1.0, max_seconds=2.0)
+    segments = segmenter.feed(_pcm(5.0, 3000))
+    assert len(segments) == 2
+    assert len(segmenter.flush()) == len(_pcm(1.0, 3000))
@@ -0,0 +1,46 @@
+from src.code_cache import CodeCache
+
+CODE = """tasks = client.get_tasks(FilterTaskNameMatches("Купить хлеб"))
+for task in tasks[:3]:
+    print(task.content)
+"""
+
+
+def test_cached_code_is_reused_with_new_slot_values():
+    cache = CodeCache()
+    assert cache.store("Найди задачу купить хлеб, покажи 3.", CODE, "spec")
+
+    code = cache.lookup("найди задачу купить молоко покажи 5", "spec")
+    assert code is not None
+    assert "FilterTaskNameMatches('Купить молоко')" in code
+    assert "tasks[:5]" in code
+    assert cache.lookup("удали задачу купить молоко", "spec") is None
+
+
+def test_several_number_slots():
+    cache = CodeCache()
+    assert cache.store("покажи 5 и 7 и 1", "print(5, 7, 1)", "spec")
+    assert cache.lookup("покажи 2 и 3 и 1", "spec") == "print(2, 3, 1)"
+
+
+def test_spec_change_invalidates_entries():
+    cache = CodeCache()
+    code = "print(len(client.get_tasks()))"
+    assert cache.store("сколько задач на сегодня", code, "spec")
+    assert cache.lookup("Сколько задач на сегодня?", "spec") == code
+    assert cache.lookup("сколько задач на сегодня", "new spec") is None
+
+
+def test_context_dependent_code_is_not_cached():
+    cache = CodeCache()
+    dated = "today = client.get_date_cls()(2026, 10, 17)\nprint(today)"
+    assert not cache.store("сколько задач на сегодня", dated, "spec")
+    from_context = 'print(client.get_tasks(FilterTaskNameMatches("купить хлеб")))'
+    assert not cache.store("покажи её", from_context, "spec")
+    mutation = (
+        'for t in client.get_tasks(FilterTaskNameMatches("купить хлеб")):\n'
+        "    client.complete_task(t.id)"
+    )
+    assert not cache.store("отметь купить хлеб выполненной", mutation, "spec")
+    assert cache.lookup("сколько задач на сегодня", "spec") is None
+    assert cache.lookup("отметь купить хлеб выполненной", "spec") is None
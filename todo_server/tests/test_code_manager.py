@@ -1,4 +1,8 @@
+import asyncio
+from unittest.mock import Mock
+
 from src.code_manager import CodeManager
+from src.task_client import TaskClient
 
 
 def test_list_empty_projects():
@@ -24,3 +28,110 @@ print(count_tasks_for_today(client))"""
     manager = CodeManager()
     result = manager.execute(code)
     assert result[0]
+
+
+def test_run_times_out_and_replaces_worker():
+
+    manager = CodeManager(workers=1, timeout=2.0)
+    client = Mock(spec=TaskClient)
+    client.batched.return_value = client
+
+    async def scenario():
+        try:
+            stuck = await manager.run(client, "while True:\n    pass")
+            ok = await manager.run(client, "print(40 + 2)")
+        finally:
+            await manager.aclose()
+        return stuck, ok
+
+    stuck, ok = asyncio.run(scenario())
+    assert "timed out" in stuck
+    assert ok.endswith("42")
+
+
+def test_cancelled_run_still_flushes_queued_writes():
+
+    manager = CodeManager(workers=1, timeout=10.0)
+    client = Mock(spec=TaskClient)
+    client.batched.return_value = client
+    code = 'client.add_task("Купить хлеб")\nwhile True:\n    pass'
+
+    async def scenario():
+        try:
+            run = asyncio.create_task(manager.run(client, code))
+            while not client.add_task.called:
+                await asyncio.sleep(0.05)
+            _ = run.cancel()
+            try:
+                await run
+            except asyncio.CancelledError:
+                pass
+        finally:
+            await manager.aclose()
+
+    asyncio.run(scenario())
+    client.flush.assert_awaited_once()
+
+
+def test_scripts_cannot_import_or_open_files():
+
+    manager = CodeManager()
+    client = Mock(spec=TaskClient)
+    result = manager.execute(client, "import os\nprint(os.getcwd())")
+    assert "not allowed" in result
+    result = manager.execute(client, 'open("/etc/passwd")')
+    assert result.startswith("Error executing code")
+    result = manager.execute(client, "from datetime import date\nprint(date(2025, 1, 2).day)")
+    assert result.endswith("2")
+
+
+def test_scripts_can_use_dates():
+
+    manager = CodeManager()
+    client = Mock(spec=TaskClient)
+    client.get_date_cls = TaskClient.get_date_cls
+    client.get_datetime_cls = TaskClient.get_datetime_cls
+    code = """date = client.get_date_cls()
+datetime = client.get_datetime_cls()
+print(date.today() == datetime.now().date())
+print(datetime.now().strftime("%Y-%m-%d") == str(date.today()))
+print(datetime.strptime("2025-06-21", "%Y-%m-%d").day)"""
+    result = manager.execute(client, code)
+    assert result == "Successfully executed code:\n True\nTrue\n21"
+
+
+def test_memory_limit_is_reported():
+
+    manager = CodeManager(workers=1, memory_limit=256 * 1024 * 1024)
+    client = Mock(spec=TaskClient)
+    client.batched.return_value = client
+
+    async def scenario():
+        try:
+            return await manager.run(client, "x = [0] * (10**9)")
+        finally:
+            await manager.aclose()
+
+    assert asyncio.run(scenario()) == "Error executing code: memory limit exceeded"
+
+
+def test_aclose_stops_busy_workers():
+
+    manager = CodeManager(workers=1, timeout=10.0)
+    client = Mock(spec=TaskClient)
+    client.batched.return_value = client
+
+    async def scenario():
+        manager.start()
+        (worker,) = manager._all
+        run = asyncio.create_task(manager.run(client, "while True:\n    pass"))
+        await asyncio.sleep(0.5)
+        await manager.aclose()
+        result = await asyncio.wait_for(run, timeout=5.0)
+        return worker, result
+
+    worker, result = asyncio.run(scenario())
+    assert "worker process died" in result
+    worker.process.join(timeout=5.0)
+    assert worker.process.exitcode is not None
+    assert not manager._all
@@ -0,0 +1,28 @@
+from datetime import date, timedelta
+from types import SimpleNamespace
+
+from src.context_selector import rank_tasks
+
+
+def _task(task_id, content, project_id="p1", due=None):
+    return SimpleNamespace(
+        id=task_id,
+        content=content,
+        project_id=project_id,
+        due=SimpleNamespace(date=due) if due else None,
+        updated_at=None,
+    )
+
+
+def test_rank_tasks_prefers_lexical_match_then_due_soon():
+    projects = {
+        "p1": SimpleNamespace(name="Inbox", is_favorite=False),
+        "p2": SimpleNamespace(name="Книги", is_favorite=False),
+    }
+    tasks = [
+        _task("t1", "позвонить маме"),
+        _task("t2", "оплатить счета", due=date.today() + timedelta(days=1)),
+        _task("t3", "дочитать книгу", project_id="p2"),
+    ]
+    ranked = rank_tasks(projects, tasks, "какие у меня книги")
+    assert [task.id for task in ranked] == ["t3", "t2", "t1"]
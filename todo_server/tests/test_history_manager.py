@@ -0,0 +1,14 @@
+from src.history_manager import HistoryManager
+
+
+def test_history_is_compacted_to_budget():
+    history = HistoryManager(token_budget=200, max_block_chars=100, max_summarized=2)
+    for i in range(5):
+        history.add(f"request {i}", "print(1)\n" * 50, "ok", f"answer {i}")
+
+    messages = history.messages()
+    summary = messages[0]["content"]
+    assert "request 0" not in summary
+    assert "request 2 -> answer 2" in summary
+    assert "request 4" in messages[-2]["content"]
+    assert "more characters trimmed" in messages[-1]["content"]
@@ -0,0 +1,51 @@
+import asyncio
+import os
+
+from src.shared_store import (
+    LeaderLock,
+    request_sync,
+    snapshot_version,
+    sync_requested_since,
+)
+from src.todoist_manager import TodoistManagerSyncEndpoint
+
+
+def test_only_one_process_leads(tmp_path):
+    path = str(tmp_path / "sync.lock")
+    leader, follower = LeaderLock(path), LeaderLock(path)
+    assert leader.try_acquire()
+    assert not follower.try_acquire()
+    leader.release()
+    assert follower.try_acquire()
+    follower.release()
+
+
+def test_snapshot_version_changes_on_replace(tmp_path):
+    path = tmp_path / "sync.snapshot"
+    assert snapshot_version(str(path)) is None
+    path.write_bytes(b"one")
+    first = snapshot_version(str(path))
+    (tmp_path / "new").write_bytes(b"second")
+    os.replace(tmp_path / "new", path)
+    assert snapshot_version(str(path)) != first
+
+
+def test_sync_request(tmp_path):
+    path = str(tmp_path / "sync.request")
+    assert not sync_requested_since(path, 0.0)
+    request_sync(path)
+    assert sync_requested_since(path, 0.0)
+
+
+def test_follower_picks_up_published_snapshot(todoist_env):
+    leader = TodoistManagerSyncEndpoint(shared=True)
+    follower = TodoistManagerSyncEndpoint(shared=True)
+    items = [{"id": "t1", "project_id": "p1", "content": "a", "due": None}]
+    leader._store.write("token", [], items, full_sync=True)
+    leader._write_snapshot()
+
+    asyncio.run(follower._refresh_from_snapshot())
+    assert follower._sync_token == "token"
+    assert follower._index.task_ids_in_project("p1") == ["t1"]
+    assert list(follower._items) == ["t1"]
+    assert follower._last_sync is not None
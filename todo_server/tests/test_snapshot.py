@@ -0,0 +1,46 @@
+from datetime import date
+
+import pytest
+
+from src.snapshot import LazyRecordMap, Snapshot, write_snapshot
+
+
+def test_snapshot_round_trip_decodes_lazily(tmp_path):
+    path = str(tmp_path / "sync.snapshot")
+    projects = [{"id": "p1", "name": "Inbox"}]
+    items = [
+        {"id": "t1", "project_id": "p1", "content": "a", "due": {"date": "2025-06-21"}},
+        {"id": "t2", "project_id": "p1", "content": "b", "due": None},
+    ]
+    write_snapshot(path, "token", projects, items)
+
+    snapshot = Snapshot(path)
+    assert snapshot.sync_token == "token"
+    assert snapshot.record(snapshot.projects[0]) == projects[0]
+    assert [(e.id, e.project_id, e.due_day) for e in snapshot.items] == [
+        ("t1", "p1", date(2025, 6, 21)),
+        ("t2", "p1", None),
+    ]
+
+    decoded: list[str] = []
+
+    def factory(raw):
+        decoded.append(raw["id"])
+        return raw
+
+    lazy = LazyRecordMap(snapshot, factory)
+    for entry in snapshot.items:
+        lazy.add_pending(entry)
+    assert list(lazy) == ["t1", "t2"]
+    assert lazy["t2"] == items[1]
+    assert decoded == ["t2"]
+
+
+def test_snapshot_rejects_corruption(tmp_path):
+    path = tmp_path / "sync.snapshot"
+    write_snapshot(str(path), "token", [], [{"id": "t1", "project_id": "p1"}])
+    data = bytearray(path.read_bytes())
+    data[-2] ^= 0xFF
+    path.write_bytes(bytes(data))
+    with pytest.raises(ValueError):
+        _ = Snapshot(str(path))
@@ -0,0 +1,25 @@
+from src.sync_store import SyncStore
+
+
+def test_write_applies_only_delta(tmp_path):
+    store = SyncStore(str(tmp_path / "sync.db"))
+    store.write(
+        "token-1",
+        [{"id": "p1", "name": "Inbox"}],
+        [{"id": "t1", "content": "a"}, {"id": "t2", "content": "b"}],
+        full_sync=True,
+    )
+    store.write(
+        "token-2",
+        [],
+        [{"id": "t1", "content": "a2"}, {"id": "t2", "checked": True}],
+    )
+    token, projects, items = store.load()
+    assert token == "token-2"
+    assert projects == [{"id": "p1", "name": "Inbox"}]
+    assert items == [{"id": "t1", "content": "a2"}]
+
+
+def test_empty_store_requests_full_sync(tmp_path):
+    token, projects, items = SyncStore(str(tmp_path / "sync.db")).load()
+    assert (token, projects, items) == ("*", [], [])
@@ -1,10 +1,17 @@
+import asyncio
 import pytest
 from datetime import date
-from unittest.mock import Mock, MagicMock
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, Mock, MagicMock
 from todoist_api_python.models import Task as TodoistTask, Due
 
 from src.task_client import TaskClient, Task
-from src.todoist_manager import TodoistManagerSyncEndpoint
+from src.todoist_manager import (
+    FilterAND,
+    FilterProjectId,
+    FilterTaskDue,
+    TodoistManagerSyncEndpoint,
+)
 
 
 def test_add_task():
@@ -52,3 +59,68 @@ def test_add_task():
     assert result.project_id == "2316809606"
     assert result.priority == 1
     assert result.due == date(2025, 6, 21)
+
+
+def test_batched_writes_are_sent_in_one_commit(todoist_env):
+    mock_todoist_ro = Mock(spec=TodoistManagerSyncEndpoint)
+    mock_todoist_ro.commit = AsyncMock(return_value={})
+    client = TaskClient(mock_todoist_ro).batched()
+    client.todoist = Mock()
+
+    project = client.add_project("Покупки")
+    task = client.add_task(
+        "Купить хлеб", project_id=project.id, due_date=date(2025, 6, 21)
+    )
+    assert client.complete_task(task.id)
+    client.todoist.add_task.assert_not_called()
+
+    mock_todoist_ro.commit.return_value = {project.id: "p1", task.id: "t1"}
+    asyncio.run(client.flush())
+
+    (commands,) = mock_todoist_ro.commit.call_args.args
+    assert [command["type"] for command in commands] == [
+        "project_add",
+        "item_add",
+        "item_close",
+    ]
+    assert commands[1]["args"]["project_id"] == project.id
+    assert commands[1]["args"]["due"] == {"date": "2025-06-21"}
+    assert not client.has_pending_writes()
+
+    assert client.remove_project(project.id)
+    assert client._commands[0]["args"] == {"id": "p1"}
+
+
+def test_temp_ids_resolve_in_filters_and_read_back(todoist_env):
+    mock_todoist_ro = Mock(spec=TodoistManagerSyncEndpoint)
+    client = TaskClient(mock_todoist_ro).batched()
+    project = client.add_project("Покупки")
+    task = client.add_task("Купить хлеб", project_id=project.id)
+    mock_todoist_ro.commit = AsyncMock(
+        return_value={project.id: "p1", task.id: "t1"}
+    )
+    asyncio.run(client.flush())
+
+    mock_todoist_ro.get_tasks.return_value = [
+        SimpleNamespace(
+            id="t1", content="Купить хлеб", project_id="p1", priority=1, due=None
+        )
+    ]
+    query = FilterAND([FilterProjectId(project.id), FilterTaskDue()])
+    (read_back,) = client.get_tasks(query)
+    (sent,) = mock_todoist_ro.get_tasks.call_args.args
+    assert sent == FilterAND([FilterProjectId("p1"), FilterTaskDue()])
+    # The script's own filter object is left as it was
+    assert query.filters[0].id == project.id
+    assert (read_back.id, read_back.project_id) == (task.id, project.id)
+
+
+def test_failed_flush_keeps_queued_writes(todoist_env):
+    mock_todoist_ro = Mock(spec=TodoistManagerSyncEndpoint)
+    mock_todoist_ro.commit = AsyncMock(side_effect=RuntimeError("rejected"))
+    client = TaskClient(mock_todoist_ro).batched()
+    _ = client.add_project("Покупки")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(client.flush())
+    assert client.has_pending_writes()
@@ -1,6 +1,18 @@
-from src.todoist_manager import TodoistManager
 import asyncio
-import pytest
+import sqlite3
+from datetime import date
+from types import SimpleNamespace
+
+from src.todoist_manager import (
+    ContextCache,
+    FilterAND,
+    FilterOR,
+    FilterProjectName,
+    FilterTaskDue,
+    FilterTaskNameMatches,
+    TodoistManager,
+    format_context,
+)
 
 
 def test_tasks():
@@ -15,3 +27,136 @@ def test_get_code_info():
     code_info = todoist_manager.get_code_info()
     print(code_info)
     assert isinstance(code_info, str)
+
+
+def test_context_cache_rerenders_only_invalidated_projects():
+    projects = [SimpleNamespace(id="p1", name="Inbox"), SimpleNamespace(id="p2", name="Books")]
+    tasks = [
+        SimpleNamespace(id="t1", content="milk", project_id="p1", due=None),
+        SimpleNamespace(id="t2", content="read", project_id="p2", due=None),
+    ]
+    cache = ContextCache()
+    assert cache.render(projects, tasks) == format_context(projects, tasks)
+
+    tasks[0] = SimpleNamespace(id="t1", content="bread", project_id="p1", due=None)
+    # Not invalidated yet, so the cached text is reused
+    assert "milk" in cache.render(projects, tasks)
+    cache.invalidate({"p1"})
+    assert cache.render(projects, tasks) == format_context(projects, tasks)
+
+
+def test_sync_tombstones_evict_items(sync_store):
+    for task_id, project_id in [("t1", "p1"), ("t2", "p2"), ("t3", "p2")]:
+        sync_store._put_item(
+            SimpleNamespace(id=task_id, project_id=project_id, due=None)
+        )
+    touched = sync_store._apply_delta(
+        [], [{"id": "t1", "is_deleted": True}, {"id": "t2", "checked": True}]
+    )
+    assert list(sync_store._items) == ["t3"]
+    assert touched == {"p1", "p2"}
+
+
+def test_indexed_filters(sync_store):
+    sync_store._put_project(SimpleNamespace(id="p1", name="Inbox"))
+    sync_store._put_project(SimpleNamespace(id="p2", name="Books"))
+    for task_id, project_id, day in [
+        ("t1", "p1", date(2025, 6, 20)),
+        ("t2", "p1", date(2025, 6, 22)),
+        ("t3", "p2", date(2025, 6, 21)),
+        ("t4", "p2", None),
+    ]:
+        due = SimpleNamespace(date=day) if day else None
+        content = "buy a book" if task_id == "t4" else "task"
+        sync_store._put_item(
+            SimpleNamespace(id=task_id, project_id=project_id, due=due, content=content)
+        )
+
+    def ids(filter_obj):
+        return sorted(task.id for task in sync_store.get_tasks(filter_obj))
+
+    assert ids(FilterProjectName("Books")) == ["t3", "t4"]
+    assert ids(FilterTaskDue(before=date(2025, 6, 22))) == ["t1", "t3"]
+    assert ids(FilterTaskDue(on=date(2025, 6, 22))) == ["t2"]
+    assert ids(
+        FilterAND([FilterProjectName("Inbox"), FilterTaskDue(after=date(2025, 6, 20))])
+    ) == ["t2"]
+
+    assert ids(
+        FilterOR([FilterProjectName("Missing"), FilterTaskNameMatches("BOOK")])
+    ) == ["t4"]
+
+    sync_store._drop_item("t2")
+    assert ids(FilterTaskDue(after=date(2025, 6, 20))) == ["t3"]
+
+
+def test_background_sync_loop_backs_off_and_stops(monkeypatch, sync_store):
+    sync_store.sync_interval = 10.0
+    real_sleep = asyncio.sleep
+    delays: list[float] = []
+    calls = 0
+
+    async def fake_sleep(delay):
+        delays.append(delay)
+        await real_sleep(0)
+
+    async def fake_sync():
+        nonlocal calls
+        calls += 1
+        if calls <= 2:
+            raise RuntimeError("offline")
+
+    monkeypatch.setattr(asyncio, "sleep", fake_sleep)
+    monkeypatch.setattr(sync_store, "sync", fake_sync)
+
+    async def scenario():
+        sync_store.start()
+        while calls < 4:
+            await real_sleep(0)
+        task = sync_store._sync_task
+        await sync_store.aclose()
+        return task
+
+    task = asyncio.run(scenario())
+    # Two failures back off, a success goes back to the regular interval
+    assert delays[:4] == [20.0, 40.0, 10.0, 10.0]
+    assert task.cancelled()
+    assert sync_store._sync_task is None
+
+
+def test_failed_store_write_keeps_the_persisted_token(monkeypatch, sync_store):
+    item = {"id": "t1", "is_deleted": True}
+    sync_store._put_item(SimpleNamespace(id="t1", project_id="p1", due=None))
+    sent_tokens: list[str] = []
+
+    async def post(url, headers, data):
+        sent_tokens.append(data["sync_token"])
+        body = {"sync_token": f"token{len(sent_tokens)}", "items": [item]}
+        return SimpleNamespace(raise_for_status=lambda: None, json=lambda: body)
+
+    def locked(*args):
+        raise sqlite3.OperationalError("database is locked")
+
+    sync_store._http_client = SimpleNamespace(post=post)
+    real_write = sync_store._store.write
+    monkeypatch.setattr(sync_store._store, "write", locked)
+    asyncio.run(sync_store.sync())
+    assert sync_store._sync_token == "*"
+    assert not sync_store._items
+
+    monkeypatch.setattr(sync_store._store, "write", real_write)
+    asyncio.run(sync_store.sync())
+    # The delta is asked for again from the token the store is at
+    assert sent_tokens == ["*", "*"]
+    assert sync_store._store.sync_token() == "token2"
+
+
+def test_refresh_serves_the_local_store_when_sync_fails(sync_store):
+    sync_store._put_item(SimpleNamespace(id="t1", project_id="p1", due=None))
+
+    async def post(url, headers, data):
+        raise OSError("network is unreachable")
+
+    sync_store._http_client = SimpleNamespace(post=post)
+    asyncio.run(sync_store.refresh())
+    assert [task.id for task in sync_store.get_tasks()] == ["t1"]
@@ -0,0 +1,54 @@
+import asyncio
+import threading
+import time
+
+from src.tts_manager import TTSManager, split_sentences
+
+
+def test_split_sentences_keeps_unfinished_tail():
+    sentences, rest = split_sentences("У вас две задачи. Первая — купить хлеб! Втор")
+    assert sentences == ["У вас две задачи.", "Первая — купить хлеб!"]
+    assert rest == "Втор"
+
+
+def test_split_sentences_waits_for_whitespace_after_period():
+    sentences, rest = split_sentences("Готово.")
+    assert sentences == []
+    assert rest == "Готово."
+
+
+def test_stopped_speech_stops_reading_the_stream(monkeypatch, tmp_path):
+
+    monkeypatch.setenv("ELEVENLABS_API_KEY", "test")
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    tts_manager = TTSManager()
+    read: list[int] = []
+    closed = threading.Event()
+
+    def fake_generate(text, stream=False):
+        try:
+            for i in range(1000):
+                time.sleep(0.01)
+                read.append(i)
+                yield b"chunk"
+        finally:
+            closed.set()
+
+    monkeypatch.setattr(tts_manager, "_generate", fake_generate)
+
+    async def text_deltas():
+        yield "Первая задача."
+
+    async def scenario():
+        speech = tts_manager.stream_speech(text_deltas())
+        assert await anext(speech) == b"chunk"
+        await speech.aclose()
+
+    asyncio.run(scenario())
+    assert closed.wait(timeout=2.0)
+    assert len(read) < 1000
+    assert tts_manager.cache.get(tts_manager._cache_key("Первая задача.")) is None
+
+    stop = threading.Event()
+    stop.set()
+    assert tts_manager.text_to_speech("Вторая задача.", stop) == ""